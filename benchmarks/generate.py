@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+
+Synthetic key, rule and record generators for benchmarking
+
+Each couplet at level :code:`L` of the key splits the records on attribute :code:`N{L}` (ranges)
+or :code:`T{L}` (text). Every record follows exactly one path, so generated records are always classified.
+Extra clauses on the :code:`DESC` attribute that never match can be added to each ruleset to make
+the expressions more complex without changing the classification.
+
+"""
+
+__all__ = ['OPERATORS', 'generate', 'generate_key', 'generate_records']
+
+import random
+
+import numpy as np
+import pandas as pd
+
+OPERATORS = ('=', 'in', 'regex', 'range')
+
+RULE_COLUMNS = ['ID', 'ATTRIBUTE', 'OPERATOR', 'VALUE', 'NAME', 'COMMENTS']
+KEY_COLUMNS = ['INPUT_COUPLET', 'RULES', 'OUTPUT_COUPLET', 'OUTPUT_CLASS', 'OUTPUT_NAME', 'COMMENTS']
+
+
+def generate(depth=4, fanout=3, complexity=0, operators=OPERATORS, records=10000, duplication=0.5, seed=0):
+    """
+    Generate a synthetic key, rules and records
+
+    Args:
+        depth (int): number of couplet levels, the key has :code:`fanout ** depth` classes
+        fanout (int): number of edges out of each couplet
+        complexity (int): number of extra clauses in each ruleset expression
+        operators (iterable): operators to split couplets with, any of benchmarks.generate.OPERATORS
+        records (int): number of records
+        duplication (float): fraction of records that duplicate another record's attribute values
+        seed (int): random seed
+
+    Returns:
+        tuple(pandas.DataFrame, pandas.DataFrame, pandas.DataFrame): key_df, rules_df and records
+    """
+    key_df, rules_df = generate_key(depth, fanout, complexity, operators, seed)
+    return key_df, rules_df, generate_records(records, depth, fanout, duplication, seed)
+
+
+def generate_key(depth=4, fanout=3, complexity=0, operators=OPERATORS, seed=0):
+    """
+    Generate a synthetic key and rules
+
+    Args:
+        depth (int): number of couplet levels, the key has :code:`fanout ** depth` classes
+        fanout (int): number of edges out of each couplet
+        complexity (int): number of extra clauses in each ruleset expression
+        operators (iterable): operators to split couplets with, any of benchmarks.generate.OPERATORS
+        seed (int): random seed
+
+    Returns:
+        tuple(pandas.DataFrame, pandas.DataFrame): key_df and rules_df
+    """
+    rng = random.Random(seed)
+    operators = list(operators)
+    unknown = set(operators) - set(OPERATORS)
+    if unknown:
+        raise ValueError('Unknown operators {}'.format(sorted(unknown)))
+
+    rules, edges = [], []
+
+    def rule(attribute, operator, value):
+        rules.append((len(rules) + 1, attribute, operator, value, '{} {} {}'.format(attribute, operator, value), ''))
+        return len(rules)
+
+    couplets = [(0, 0)]  # couplet ID, level
+    next_id = 1
+    while couplets:
+        couplet, level = couplets.pop(0)
+        operator = rng.choice(operators)
+        for i, expr in enumerate(_split(rule, operator, level, fanout)):
+            for _ in range(complexity):
+                expr = '({}) and not {}'.format(expr, rule('DESC', rng.choice(['=', 'in', 'regex']), _never(rng)))
+
+            if level + 1 == depth:
+                edges.append((couplet, expr, None, next_id, 'Class {}'.format(next_id), ''))
+            else:
+                edges.append((couplet, expr, next_id, None, 'Couplet {}'.format(next_id), ''))
+                couplets.append((next_id, level + 1))
+            next_id += 1
+
+    return pd.DataFrame(edges, columns=KEY_COLUMNS), pd.DataFrame(rules, columns=RULE_COLUMNS)
+
+
+def _split(rule, operator, level, fanout):
+    """Ruleset expressions that split a couplet's records by their value for the level"""
+    if operator == 'range':
+        # [i, i + 1) as i + 0.5 is the value for branch i
+        bounds = [rule('N{}'.format(level), '>=', str(i)) for i in range(1, fanout)]
+        exprs = ['not {}'.format(bounds[0])]
+        exprs += ['{} and not {}'.format(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        return exprs + [str(bounds[-1])]
+
+    attribute = 'T{}'.format(level)
+    if operator == 'regex':
+        values = [r'^-{}-$'.format(i) for i in range(fanout - 1)]
+    else:
+        values = ['-{}-'.format(i) for i in range(fanout - 1)]
+    ids = [rule(attribute, operator, value) for value in values]
+    return [str(i) for i in ids] + ['not ({})'.format(' or '.join(str(i) for i in ids))]
+
+
+def _never(rng):
+    """Text that never occurs in a generated DESC"""
+    return 'ZZ{}'.format(rng.randint(0, 10 ** 6))
+
+
+def generate_records(records=10000, depth=4, fanout=3, duplication=0.5, seed=0):
+    """
+    Generate synthetic records for a key from benchmarks.generate.generate_key
+
+    Args:
+        records (int): number of records
+        depth (int): number of couplet levels
+        fanout (int): number of edges out of each couplet
+        duplication (float): fraction of records that duplicate another record's attribute values
+        seed (int): random seed
+
+    Returns:
+        pandas.DataFrame: ID, DESC and N{level}/T{level} for each level
+    """
+    rng = np.random.default_rng(seed)
+    unique = max(1, int(round(records * (1 - duplication))))
+
+    branches = rng.integers(0, fanout, size=(unique, depth))
+    rows = np.concatenate([np.arange(unique), rng.integers(0, unique, size=records - unique)])[:records]
+    rng.shuffle(rows)
+    branches = branches[rows]
+
+    data = {'ID': np.arange(records)}
+    for level in range(depth):
+        data['N{}'.format(level)] = branches[:, level] + 0.5
+        data['T{}'.format(level)] = np.array(['-{}-'.format(b) for b in range(fanout)], dtype=object)[branches[:, level]]
+    data['DESC'] = np.array(['Synthetic record description with some long free text {}'.format(i)
+                             for i in range(unique)], dtype=object)[rows]
+
+    return pd.DataFrame(data)
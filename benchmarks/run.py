@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+
+Run the benchmarks and compare them to a baseline
+
+Usage::
+
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+Each benchmark reports the best time of a number of repeats, the throughput in records per second
+(or rows per second for the build and compile benchmarks) and the peak memory allocated while it runs.
+The compiled benchmark only times classifying with a key that was already compiled, see the compile benchmark.
+The import benchmarks time a fresh interpreter importing victa, so they include interpreter startup.
+
+"""
+
+__all__ = ['BENCHMARKS', 'SETUP', 'PARAMS', 'run', 'compare', 'main']
+
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from victa import ClassificationError, Key, MultipleMatchesError, build_key, build_rules
+
+from .generate import OPERATORS, generate
+
+
+def _classify(key, records):
+    for idx, record in records.iterrows():
+        try:
+            key.classify(record, id_field='ID', lightweight=True)
+        except (ClassificationError, MultipleMatchesError):
+            pass
+
+
+def _key(key):
+    return key
+
+
+def _import(statement):
+    subprocess.check_call([sys.executable, '-c', statement])
+
+
+def _compiled(compiled, records):
+    for idx, record in records.iterrows():
+        compiled(record)
+
+
+# name: (function(key_df, rules_df, records, key, options), number of items processed)
+BENCHMARKS = OrderedDict([
+    ('import', (lambda k, r, rec, key, opts: _import('import victa'), lambda k, r, rec: 1)),
+    ('import_key', (lambda k, r, rec, key, opts: _import('from victa import Key'), lambda k, r, rec: 1)),
+    ('build_rules', (lambda k, r, rec, key, opts: build_rules(r.copy()), lambda k, r, rec: len(r))),
+    ('build_key', (lambda k, r, rec, key, opts: build_key(k.copy(), 'Benchmark'), lambda k, r, rec: len(k))),
+    ('Key', (lambda k, r, rec, key, opts: Key(k.copy(), 'Benchmark', r.copy()), lambda k, r, rec: len(k))),
+    ('classify', (lambda k, r, rec, key, opts: _classify(key, rec), lambda k, r, rec: len(rec))),
+    ('compile', (lambda k, r, rec, key, opts: key.compile(), lambda k, r, rec: len(k))),
+    ('compiled', (lambda k, r, rec, compiled, opts: _compiled(compiled, rec), lambda k, r, rec: len(rec))),
+    ('classify_iter', (lambda k, r, rec, key, opts: all(True for _ in key.classify_iter(rec, 'ID')),
+                       lambda k, r, rec: len(rec))),
+    ('classify_table', (lambda k, r, rec, key, opts: key.classify_table(rec, 'ID'), lambda k, r, rec: len(rec))),
+    ('classify_frame', (lambda k, r, rec, key, opts: key.classify_frame(rec, 'ID', errors='ignore'),
+                        lambda k, r, rec: len(rec))),
+    ('classify_parallel', (lambda k, r, rec, key, opts: key.classify_parallel(rec, 'ID', opts.workers, opts.chunksize),
+                           lambda k, r, rec: len(rec))),
+])
+
+# Untimed preparation of the key passed to a benchmark, by benchmark name
+SETUP = {
+    'compiled': lambda key: key.compile(),
+}
+
+# Options that change what is measured, results are only comparable if they're the same
+PARAMS = ('depth', 'fanout', 'complexity', 'operators', 'records', 'duplication', 'seed', 'cache_size',
+          'workers', 'chunksize')
+
+
+def run(names, options):
+    """
+    Run benchmarks
+
+    Args:
+        names (iterable): benchmark names, see benchmarks.run.BENCHMARKS
+        options (argparse.Namespace): generator and benchmark options, see benchmarks.run.main
+
+    Returns:
+        dict: seconds, throughput (items per second) and peak_mb for each benchmark
+    """
+    key_df, rules_df, records = generate(options.depth, options.fanout, options.complexity, options.operators,
+                                         options.records, options.duplication, options.seed)
+    results = OrderedDict()
+    for name in names:
+        func, size = BENCHMARKS[name]
+        setup = SETUP.get(name, _key)
+        items = size(key_df, rules_df, records)
+
+        seconds = float('inf')
+        for _ in range(options.repeat):
+            key = setup(Key(key_df.copy(), 'Benchmark', rules_df.copy(), cache_size=options.cache_size))
+            gc.collect()
+            start = time.perf_counter()
+            func(key_df, rules_df, records, key, options)
+            seconds = min(seconds, time.perf_counter() - start)
+
+        # Memory is measured separately as tracing slows everything down
+        key = setup(Key(key_df.copy(), 'Benchmark', rules_df.copy(), cache_size=options.cache_size))
+        gc.collect()
+        tracemalloc.start()
+        func(key_df, rules_df, records, key, options)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[name] = {'seconds': seconds, 'throughput': items / seconds, 'peak_mb': peak / 2 ** 20}
+        print('{:<20}{:>12.4f}s{:>14.0f}/s{:>12.1f}MB'.format(name, seconds, items / seconds, peak / 2 ** 20))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare benchmark results to a baseline
+
+    Args:
+        results (dict): see benchmarks.run.run
+        baseline (dict): results of an earlier run
+        tolerance (float): allowed slow down, e.g. 0.1 is 10%
+
+    Returns:
+        list: names of the benchmarks that are slower than the baseline
+    """
+    slower = []
+    print('\n{:<20}{:>12}{:>12}{:>10}'.format('benchmark', 'baseline', 'current', 'ratio'))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[name]['seconds']
+        flag = ''
+        if ratio > 1 + tolerance:
+            slower.append(name)
+            flag = '  SLOWER'
+        print('{:<20}{:>11.4f}s{:>11.4f}s{:>10.2f}{}'.format(
+            name, baseline[name]['seconds'], result['seconds'], ratio, flag))
+    return slower
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run the victa benchmarks')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='benchmarks to run, default is all of them: {}'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--depth', type=int, default=4, help='number of couplet levels')
+    parser.add_argument('--fanout', type=int, default=3, help='number of edges out of each couplet')
+    parser.add_argument('--complexity', type=int, default=1, help='extra clauses in each ruleset')
+    parser.add_argument('--operators', nargs='+', choices=OPERATORS, default=list(OPERATORS),
+                        help='operators used to split couplets')
+    parser.add_argument('--records', type=int, default=10000, help='number of records')
+    parser.add_argument('--duplication', type=float, default=0.5, help='fraction of duplicate records')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--cache-size', type=int, default=65536, help='Key result cache size')
+    parser.add_argument('--workers', type=int, default=None, help='classify_parallel workers')
+    parser.add_argument('--chunksize', type=int, default=2500, help='classify_parallel chunk size')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times each benchmark is timed')
+    parser.add_argument('--save', metavar='JSON', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='JSON', help='compare the results to a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slow down compared to the baseline')
+    options = parser.parse_args(args)
+    unknown = set(options.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(sorted(unknown))))
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        params = baseline.get('params', {})
+        different = [p for p in PARAMS if params.get(p) != getattr(options, p)]
+        if different:
+            parser.error('the baseline was run with different options: {}'.format(', '.join(
+                '{}={} (now {})'.format(p, params.get(p), getattr(options, p)) for p in different)))
+
+    results = run(options.benchmarks or list(BENCHMARKS), options)
+
+    if options.save:
+        params = {k: v for k, v in vars(options).items() if k not in ('benchmarks', 'save', 'compare')}
+        with open(options.save, 'w') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2)
+
+    if baseline is not None and compare(results, baseline['results'], options.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,14 @@
 import os
-import pandas as pd
-from victa import Key, ClassificationError, MultipleMatchesError
+from victa import Key, read_table
 
 if __name__ == '__main__':
 
     id_field = 'NVIS_ID'
 
     output_results = '../data/mvgs_nvis_results.xlsx'
-    output_steps = '../data/mvgs_nvis_steps.xlsx'
+    output_paths = '../data/mvgs_nvis_paths.xlsx'
 
-    for output in (output_results, output_steps):
+    for output in (output_results, output_paths):
         if os.path.exists(output):
             os.unlink(output)
 
@@ -19,8 +18,9 @@ if __name__ == '__main__':
     # a database, url, etc...
     # All we need is pandas.DataFrame objects conforming to the structures
     # documented in victa.rules.build_rules and victa.key.build_key
-    ruledf = pd.read_excel(open('../data/rules_nvis.xlsx', 'rb'))
-    keydf = pd.read_excel(open('../data/keys_nvis.xlsx', 'rb'))
+    # read_table keeps text like 'NULL' & 'NA' rather than reading them as NaN
+    ruledf = read_table('../data/rules_nvis.xlsx')
+    keydf = read_table('../data/keys_nvis.xlsx')
 
     # Build key
     key = Key(keydf, 'MVG Key', ruledf)
@@ -28,26 +28,19 @@ if __name__ == '__main__':
     # Read in tha records
     # Here we read from a spreadsheet, but you could get the data from anywhere,
     # a database, url, etc... All we need is a pandas.DataFrame object
-    recsdf = pd.read_excel(open('../data/FLATNVIS_VEG_DESC5.xlsx', 'rb'))
-
-    # iterate yerself
-    all_results = []
-    all_steps = []
-    for idx, record in recsdf.iterrows():
-        try:
-            # Perform the classification
-            result, steps = key.classify(record, id_field=id_field)
-            all_results += [result]
-            all_steps += [steps]
-        except ClassificationError as e:
-            print(e)
-            # Can also do something with e.record and e.steps
-        except MultipleMatchesError as e:
-            print(e)
-            # Can also do something with e.record, e.couplet and e.rulesets
+    recsdf = read_table('../data/FLATNVIS_VEG_DESC5.xlsx')
+
+    # Perform the classification, results are collected in columnar arrays
+    # and only converted to DataFrames at the end.
+    # Or iterate yerself with key.classify(record, id_field=id_field)
+    results = key.classify_table(recsdf, id_field=id_field)
+
+    # Records that couldn't be classified have a status of 'unclassified' or 'multiple matches'
+    all_results = results.to_frame()
+    print(all_results['status'].value_counts())
 
     # Write out the results
-    all_results = pd.DataFrame(all_results)
-    all_steps = pd.concat(all_steps, ignore_index=True)
+    # Each record only has the ID of its decision path, the couplets in each distinct path
+    # are written once and can be joined to the results on path_id
     all_results.to_excel(output_results, index=False)
-    all_steps.to_excel(output_steps, index=False)
+    results.path_table().to_excel(output_paths, index=False)
@@ -1,7 +1,8 @@
 import getpass
+import os
 import pandas as pd
 import sqlalchemy
-from victa import Key, ClassificationError, MultipleMatchesError
+from victa import Key, read_table
 
 
 if __name__ == '__main__':
@@ -15,10 +16,12 @@ if __name__ == '__main__':
 
     conn = sqlalchemy.create_engine('%s://%s:%s@%s'%(dbtype, user,password,tns))
 
-    output_results = '../data/mvgs_nvis_results.xlsx'
-    output_steps = '../data/mvgs_nvis_steps.xlsx'
+    chunksize = 100000  # Records held in memory at a time
 
-    for output in (output_results, output_steps):
+    output_results = '../data/mvgs_nvis_results.csv'
+    output_paths = '../data/mvgs_nvis_paths.csv'
+
+    for output in (output_results, output_paths):
         if os.path.exists(output):
             os.unlink(output)
 
@@ -28,35 +31,27 @@ if __name__ == '__main__':
     # a database, url, etc...
     # All we need is pandas.DataFrame objects conforming to the structures
     # documented in victa.rules.build_rules and victa.key.build_key
-    ruledf = pd.read_excel(open('../data/rules_nvis.xlsx', 'rb'))
-    keydf = pd.read_excel(open('../data/keys_nvis.xlsx', 'rb'))
+    # read_table keeps text like 'NULL' & 'NA' rather than reading them as NaN
+    ruledf = read_table('../data/rules_nvis.xlsx')
+    keydf = read_table('../data/keys_nvis.xlsx')
 
     # Build key
     key = Key(keydf, 'MVG Key', ruledf)
 
-    # Read in tha records
+    # Read in tha records, a chunk at a time
     # Here we read from a database table, but you could get the data from anywhere,
-    # a spreadsheet, url, etc... All we need is a pandas.DataFrame object
-    recsdf = pd.read_sql(sql, conn)
-
-    # iterate yerself
-    all_results = []
-    all_steps = []
-    for idx, record in recsdf.iterrows():
-        try:
-            # Perform the classification
-            result, steps = key.classify(record, id_field=id_field)
-            all_results += [result]
-            all_steps += [steps]
-        except ClassificationError as e:
-            print(e)
-            # Can also do something with e.record and e.steps
-        except MultipleMatchesError as e:
-            print(e)
-            # Can also do something with e.record, e.couplet and e.rulesets
-
-    # Write out the results
-    all_results = pd.DataFrame(all_results)
-    all_steps = pd.concat(all_steps, ignore_index=True)
-    all_results.to_excel(output_results, index=False)
-    all_steps.to_excel(output_steps, index=False)
+    # a csv (read_table('records.csv', chunksize=chunksize)), url, etc...
+    # All we need is an iterator of pandas.DataFrame objects
+    chunks = pd.read_sql(sql, conn, chunksize=chunksize)
+
+    # Classify and write out the results for each chunk
+    results = None
+    for results in key.classify_stream(chunks, id_field=id_field):
+        results.to_frame().to_csv(output_results, mode='a', index=False,
+                                  header=not os.path.exists(output_results))
+        print(results.to_frame()['status'].value_counts())
+
+    # Decision paths are shared by all the chunks, so the path IDs in the results
+    # can be joined to the couplets in each path
+    if results is not None:
+        results.path_table().to_csv(output_paths, index=False)
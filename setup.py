@@ -13,9 +13,12 @@ setup(
     classifiers=[
         "Development Status :: 2 - Pre-Alpha",
         "License :: OSI Approved :: Apache Software License",
+        "Programming Language :: Python :: 3 :: Only",
     ],
+    python_requires='>=3.7',
     install_requires=[
        'networkx',
+       'numpy',
        'pandas',
        'xlrd',
        'openpyxl'
@@ -0,0 +1,35 @@
+import pytest
+from victa.analysis import exclusive
+from victa.rules import Rule, RuleSet
+
+
+@pytest.fixture
+def ruleset():
+    return RuleSet({
+        1: Rule('5', 'HEIGHT', '>=', 'Tall'),
+        2: Rule('5', 'HEIGHT', '<', 'Short'),
+        3: Rule('3', 'HEIGHT', '<', 'Very short'),
+        4: Rule('5', 'HEIGHT', '=', 'Five'),
+        5: Rule('tree', 'FORM', '=', 'Tree'),
+        6: Rule('shrub', 'FORM', '=', 'Shrub'),
+        7: Rule('euc', 'DESC', 'regex', 'Eucalypt'),
+    })
+
+
+@pytest.mark.parametrize('expr_a, expr_b, expected', [
+    ('1', 'not 1', True),
+    ('1 and 5', '1 and not 5', True),
+    ('1', '2', True),  # Disjoint numeric ranges
+    ('1', '3', True),
+    ('2', '3', False),  # Overlapping ranges
+    ('4', '2', False),  # Within the isclose tolerance
+    ('1', 'not 4', False),
+    ('5', '6', True),  # Different text
+    ('5', 'not 6', False),
+    ('7', '7 or 5', False),
+    ('7', 'not 7', True),
+    ('1', '99', False),  # Unknown rule
+])
+def test_exclusive(ruleset, expr_a, expr_b, expected):
+    assert exclusive(expr_a, expr_b, ruleset) == expected
+    assert exclusive(expr_b, expr_a, ruleset) == expected
@@ -1,8 +1,470 @@
 # TODO
 # But at least this will check for syntax errors...
+import pickle
+import re
 import pytest
+import pandas as pd
 from victa.key import *
+from victa.couplets import Couplet
+from victa.errors import (ClassificationError, ManadatoryFieldError, MultipleMatchesError, MissingAttributeError,
+                          RuleSyntaxError, StaleKeyError, ValidationError, VictaError)
 
 
 def test_todo():
     pass
+
+
+@pytest.fixture
+def rules_df():
+    return pd.DataFrame([
+        (1, 'HEIGHT', '>=', '5', 'Tall', ''),
+        (2, 'FORM', '=', 'tree', 'Tree', ''),
+        (3, 'DESC', 'regex', 'euc', 'Eucalypt', ''),
+        (4, 'DESC', 'in', 'acacia', 'Acacia', 'Some comment'),
+    ], columns=['ID', 'ATTRIBUTE', 'OPERATOR', 'VALUE', 'NAME', 'COMMENTS'])
+
+
+@pytest.fixture
+def key_df():
+    return pd.DataFrame([
+        (0, '2', 1, None, 'Trees', ''),
+        (0, 'not 2', 2, None, 'Non-trees', ''),
+        (1, '1 and 3', None, 10, 'Tall eucalypt', ''),
+        (1, '1 and not 3', None, 11, 'Tall other', ''),
+        (1, 'not 1', None, 12, 'Low tree', ''),
+        (2, '4', None, 20, 'Acacia shrub', ''),
+        (2, '4 or 3', None, 21, 'Acacia or eucalypt shrub', ''),
+    ], columns=['INPUT_COUPLET', 'RULES', 'OUTPUT_COUPLET', 'OUTPUT_CLASS', 'OUTPUT_NAME', 'COMMENTS'])
+
+
+@pytest.fixture
+def records():
+    return pd.DataFrame([
+        (1, 10.0, 'Tree', 'Eucalyptus regnans'),
+        (2, 7, 'tree', 'Angophora'),
+        (3, 2.5, 'TREE', 'Eucalyptus'),
+        (4, None, 'shrub', 'Mallee'),
+        (5, 1, 'shrub', 'Acacia eucalypt'),
+        (6, 1, 'shrub', 'Eucalypt mallee'),
+    ], columns=['id', 'height', 'form', 'desc'])
+
+
+@pytest.fixture
+def key(key_df, rules_df):
+    return Key(key_df, 'Test key', rules_df)
+
+
+def classify_all(key, records, id_field='ID'):
+    results, steps = [], []
+    for idx, record in records.iterrows():
+        try:
+            result, step = key.classify(record.copy(), id_field)
+            results.append(result)
+            steps.append(step)
+        except (ClassificationError, MultipleMatchesError):
+            pass
+    return pd.DataFrame(results), pd.concat(steps, ignore_index=True)
+
+
+def test_build_key_syntax(key_df):
+    """Test invalid rulesets are caught when the key is built"""
+    key_df.loc[3, 'RULES'] = '1 not 3'
+    with pytest.raises(RuleSyntaxError):
+        build_key(key_df, 'Test key')
+
+
+def test_build_key_validation(key_df, rules_df):
+    """Test every invalid row is reported at once"""
+    invalid = pd.concat([key_df, pd.DataFrame([
+        (0, '2', 1, None, 'Trees again', ''),
+        (2, None, None, 22, 'No rules', ''),
+        (2, 'not 4', 3, None, 'Dead end', ''),
+    ], columns=key_df.columns)], ignore_index=True)
+
+    with pytest.raises(ManadatoryFieldError) as err:
+        build_key(invalid, 'Test key')
+    assert [row for row, problem in err.value.problems] == [8, 7, 9]
+
+    with pytest.raises(ValidationError) as err:
+        build_key(invalid.drop(index=8), 'Test key')
+    assert len(err.value.problems) == 2
+
+    # Duplicate row labels, from frames concatenated without ignore_index
+    more = pd.DataFrame([(2, '4', None, 23, None, ''), (2, None, None, 22, 'No rules', '')], columns=key_df.columns)
+    with pytest.raises(ManadatoryFieldError) as err:
+        build_key(pd.concat([key_df, more]), 'Test key')
+    assert [row for row, problem in err.value.problems] == [0, 1]
+
+    key_df.loc[0, 'RULES'] = '2 and 99'
+    with pytest.raises(ValidationError, match='unknown rules 99'):
+        Key(key_df, 'Test key', rules_df)
+
+
+def test_key_graph(key):
+    """Test the networkx graph is only built on request"""
+    assert key._key is None
+    graph = key.key
+    assert graph.root.id == 0
+    assert list(graph.edges(1)) == [(1, 10), (1, 11), (1, 12)]
+    assert graph.edges[1, 11]['ruleset'] == '1 and not 3'
+    assert graph.nodes[10]['couplet'].name == 'Tall eucalypt'
+
+
+def test_classify(key, records):
+    result, steps = key.classify(records.iloc[0].copy(), 'id')
+    assert result['id'] == 10
+    assert list(steps['id']) == [0, 1, 10]
+
+
+def test_classify_iter(key, records):
+    """Test batch classification matches the scalar path and doesn't modify the records"""
+    expected_result, expected_steps = classify_all(key, records)
+    output = [(result, steps) for result, steps, record in key.classify_iter(records, 'id') if result is not None]
+
+    assert pd.DataFrame([o[0] for o in output]).equals(expected_result)
+    assert pd.concat([o[1] for o in output], ignore_index=True).equals(expected_steps)
+    assert list(records.columns) == ['id', 'height', 'form', 'desc']
+
+
+def test_classify_rule_cache(key, records):
+    """Test each rule is only tested once per record"""
+    key.classify(records.iloc[0].copy(), 'id')  # 2, not 2 | 1 and 3, 1 and not 3, not 1
+    assert key.rule_cache_hits == 4
+
+
+def test_classify_lightweight(key, records):
+    couplet, path = key.classify(records.iloc[0], 'id', lightweight=True)
+    assert couplet == Couplet(10, 'class', 'Tall eucalypt', '')
+    assert path == (0, 1, 10)
+
+
+def test_classify_records(key, records):
+    """Test dicts, namedtuples and sequences are classified the same as Series"""
+    expected = [(c.id if c else None, path) for c, path, r in key.classify_records(records.to_dict('records'))]
+    assert expected == [(10, (0, 1, 10)), (11, (0, 1, 11)), (12, (0, 1, 12)),
+                        (None, (0, 2)), (None, (0, 2)), (21, (0, 2, 21))]
+
+    rows = list(records.itertuples())
+    assert [(c.id if c else None, path) for c, path, r in key.classify_records(rows)] == expected
+    assert [r for c, path, r in key.classify_records(rows)] == rows
+    rows = [list(row) for row in records.itertuples(index=False)]
+    assert [(c.id if c else None, path) for c, path, r in key.classify_records(rows, records.columns)] == expected
+
+    key.cache.clear()
+    couplet, path = key.classify(records.iloc[0].to_dict(), 'id', lightweight=True)
+    assert (couplet.id, path) == (10, (0, 1, 10))
+    result, steps = key.classify(tuple(records.iloc[1]), 'id', columns={'id': 0, 'height': 1, 'form': 2, 'desc': 3})
+    assert result['ID'] == 2
+    with pytest.raises(MultipleMatchesError, match='ID=5'):
+        key.classify(records.iloc[4].to_dict(), 'id')
+    with pytest.raises(ClassificationError, match='record "3"'):
+        key.classify(next(records.iloc[3:].itertuples()))
+    with pytest.raises(TypeError):
+        key.classify(list(records.iloc[0]))
+
+
+def test_classify_table(key, records):
+    """Test the result table matches the scalar path"""
+    expected_result, expected_steps = classify_all(key, records)
+    table = key.classify_table(records, 'id')
+
+    result = table.to_frame()
+    assert list(result['status']) == ['classified'] * 3 + ['unclassified', 'multiple matches', 'classified']
+    assert list(result['ID']) == [1, 2, 3, 4, 5, 6]
+    classified = result[result['status'] == 'classified']
+    assert list(classified['id']) == list(expected_result['id'])
+    assert list(classified['name']) == list(expected_result['name'])
+    assert table.steps().equals(expected_steps)
+
+    assert len(table.paths) == 5
+    assert table.paths[result['path_id'][3]] == (0, 2)
+
+
+def test_classify_parallel(key, records):
+    """Test parallel classification matches the serial result table"""
+    expected = key.classify_table(records, 'id')
+    table = key.classify_parallel(records, 'id', workers=2, chunksize=4)
+
+    assert table.to_frame().drop(columns='path_id').equals(expected.to_frame().drop(columns='path_id'))
+    assert table.steps().equals(expected.steps())
+
+
+def test_classify_stream(key, records):
+    """Test chunks are classified the same as the whole table, with consistent path IDs"""
+    expected = key.classify_table(records, 'id').to_frame()
+    tables = list(key.classify_stream((records.iloc[i:i + 4] for i in range(0, len(records), 4)), 'id'))
+
+    assert len(tables) == 2
+    assert pd.concat([t.to_frame() for t in tables]).equals(expected)
+    assert tables[0].paths is tables[1].paths
+
+
+def regex_key(pattern, cache_size=65536):
+    """A key with class 10 for a HEIGHT that matches a regex, otherwise 11, so HEIGHT is tested as text"""
+    rules_df = pd.DataFrame([
+        (1, 'HEIGHT', 'regex', pattern, 'Matching height'),
+        (2, 'COVER', '>', '0', 'Some cover'),
+    ], columns=['ID', 'ATTRIBUTE', 'OPERATOR', 'VALUE', 'NAME'])
+    key_df = pd.DataFrame([
+        (0, '1 and 2', None, 10, 'Matching'),
+        (0, 'not 1 and 2', None, 11, 'Not matching'),
+    ], columns=['INPUT_COUPLET', 'RULES', 'OUTPUT_COUPLET', 'OUTPUT_CLASS', 'OUTPUT_NAME'])
+    return Key(key_df, 'Regex key', rules_df, cache_size)
+
+
+def test_classify_table_types():
+    """Test integers aren't upcast to floats once the text columns are dropped"""
+    decimal_key = regex_key(r'\.')
+    records = pd.DataFrame({'site': ['a', 'b'], 'height': [5, 6], 'cover': [0.5, 0.25]})
+    classes = list(decimal_key.classify_table(records).classes)
+    decimal_key.cache.clear()
+    expected = [result['id'] for result, steps, record in decimal_key.classify_iter(records)]
+    assert classes == expected == [11, 11]
+    assert list(decimal_key.classify_frame(records)[0]['id']) == expected
+
+
+def test_classify_cache(key, records):
+    """Test records with the same attribute values are only classified once"""
+    assert key.attributes == ('DESC', 'FORM', 'HEIGHT')
+
+    duplicates = pd.concat([records] * 3, ignore_index=True)
+    duplicates['id'] = range(len(duplicates))
+    table = key.classify_table(duplicates, 'id')
+
+    assert key.cache_info() == (12, 6, 65536, 6)
+    expected = key.classify_table(records, 'id').to_frame()
+    assert list(table.to_frame()['id'][12:]) == list(expected['id'])
+    assert list(table.to_frame()['ID']) == list(range(18))
+
+
+def test_classify_cache_types():
+    """Test results cached by one method are only reused by another for values the rules test the same"""
+    records = pd.DataFrame({'height': [5, 6], 'cover': [0.5, 0.25]})
+    for first in ('classify_table', 'classify_iter', 'classify'):
+        key = regex_key(r'\.')
+        if first == 'classify':
+            key.classify({'HEIGHT': 5, 'COVER': 0.5}, lightweight=True)
+        elif first == 'classify_iter':
+            list(key.classify_iter(records))
+        else:
+            key.classify_table(records)
+        assert key.classify({'HEIGHT': 5, 'COVER': 0.5}, lightweight=True)[0].id == 11
+        assert key.classify({'HEIGHT': 5.0, 'COVER': 0.5}, lightweight=True)[0].id == 10
+        assert list(key.classify_table(records).classes) == [11, 11]
+        assert [result['id'] for result, steps, record in key.classify_iter(records)] == [11, 11]
+        assert key.cache_info().hits
+
+    # Equal floats with a different sign
+    records = pd.DataFrame({'height': [0.0, -0.0, -0.0, 0.0], 'cover': 0.5})
+    for key in (regex_key('^-'), regex_key('^-', cache_size=0)):
+        assert list(key.classify_table(records).classes) == [11, 10, 10, 11]
+        assert key.classify({'HEIGHT': -0.0, 'COVER': 0.5}, lightweight=True)[0].id == 10
+        assert key.classify({'HEIGHT': 0.0, 'COVER': 0.5}, lightweight=True)[0].id == 11
+
+
+def test_classify_no_cache(key_df, rules_df, key, records):
+    """Test the cache isn't used at all when it's disabled"""
+    uncached = Key(key_df, 'Test key', rules_df, cache_size=0)
+    assert uncached.classify_table(records, 'id').to_frame().equals(key.classify_table(records, 'id').to_frame())
+    assert uncached.classify(records.iloc[0], lightweight=True) == key.classify(records.iloc[0], lightweight=True)
+    rows = records.to_dict('records')
+    assert list(uncached.classify_records(rows)) == list(key.classify_records(rows))
+    assert uncached.cache_info() == (0, 0, 0, 0)
+
+
+def test_key_pickle(key, records):
+    unpickled = pickle.loads(pickle.dumps(key))
+    assert unpickled.classify_table(records).to_frame().equals(key.classify_table(records).to_frame())
+
+
+def test_first_match(key_df, rules_df, records):
+    """Test couplets with mutually exclusive rulesets stop at the first match, with the same results"""
+    key = Key(key_df, 'Test key', rules_df, first_match=True)
+    assert key.graph.exclusive is None
+    assert key.exclusive[:3] == (True, True, False)
+    assert key.graph.exclusive is key.exclusive
+
+    unordered = Key(key_df, 'Test key', rules_df, first_match=False)
+    expected = unordered.classify_table(records, 'id').to_frame()
+    assert key.classify_table(records, 'id').to_frame().equals(expected)
+    assert unordered.graph.exclusive is None
+
+
+def test_profile(key_df, rules_df, records, tmp_path):
+    """Test edge match counts and that applying a profile only reorders exclusive couplets"""
+    key = Key(key_df, 'Test key', rules_df, first_match=True)
+    expected = key.classify_table(records, 'id').to_frame().drop(columns='path_id')
+
+    profile = key.profile(records)
+    assert list(profile['MATCHES']) == [3, 3, 1, 1, 1, 0, 1]
+
+    profile.to_csv(tmp_path / 'profile.csv', index=False)
+    key.apply_profile(pd.read_csv(tmp_path / 'profile.csv'))
+
+    assert key.graph.rulesets == ('2', 'not 2', 'not 1', '1 and 3', '1 and not 3', '4', '4 or 3')
+    assert key.classify_table(records, 'id').to_frame().drop(columns='path_id').equals(expected)
+    assert list(key.profile(records)['MATCHES']) == [3, 3, 1, 1, 1, 0, 1]
+
+
+def test_instrument(key_df, rules_df, records):
+    key = Key(key_df, 'Test key', rules_df, cache_size=0)
+    assert key.instrumentation is None
+
+    stats = key.instrument()
+    key.classify_table(records)
+    assert list(stats.couplets()['VISITS'][:3]) == [6, 3, 3]
+    assert list(stats.edges()['HITS']) == [3, 3, 1, 1, 1, 1, 2]
+
+    rules = stats.rules().set_index('ID')
+    assert rules.loc[2, 'EVALUATIONS'] == 6
+    assert rules.loc[2, 'TRUE_RATE'] == 0.5
+    assert (rules['SECONDS'] > 0).all()
+
+    stats = key.instrument()
+    key.classify_frame(records, errors='ignore')
+    assert list(stats.couplets()['VISITS'][:3]) == [6, 3, 3]
+    assert list(stats.edges()['HITS']) == [3, 3, 1, 1, 1, 1, 2]
+
+    assert key.instrument(False) is None
+
+
+def test_save_load(key, key_df, rules_df, records, tmp_path):
+    path = tmp_path / 'key.pkl'
+    key.save(path)
+    loaded = Key.load(path, key.fingerprint)
+    assert loaded.classify_table(records).to_frame().equals(key.classify_table(records).to_frame())
+
+    with pytest.raises(StaleKeyError):
+        Key.load(path, 'not the fingerprint')
+
+    # The header of an older format is checked without unpickling the key
+    with open(path, 'wb') as f:
+        pickle.dump({'format': 1, 'version': '0.1', 'fingerprint': key.fingerprint}, f)
+        f.write(b'cvicta.removed\nKey\n.')
+    with pytest.raises(StaleKeyError, match='different version'):
+        Key.load(path, key.fingerprint)
+
+
+def test_cached(key_df, rules_df, records, tmp_path):
+    """Test saved keys are reused until the key or rules change"""
+    path = tmp_path / 'key.pkl'
+    key_df.to_csv(tmp_path / 'key.csv', index=False)
+    rules_df.to_csv(tmp_path / 'rules.csv', index=False)
+
+    built = Key.cached(path, tmp_path / 'key.csv', 'Test key', tmp_path / 'rules.csv')
+    loaded = Key.cached(path, tmp_path / 'key.csv', 'Test key', tmp_path / 'rules.csv')
+    assert loaded.fingerprint == built.fingerprint
+    assert loaded.classify_table(records).to_frame().equals(built.classify_table(records).to_frame())
+
+    rules_df.loc[0, 'VALUE'] = '10'
+    rules_df.to_csv(tmp_path / 'rules.csv', index=False)
+    rebuilt = Key.cached(path, tmp_path / 'key.csv', 'Test key', tmp_path / 'rules.csv')
+    assert rebuilt.fingerprint != built.fingerprint
+    assert rebuilt.ruleset[1].number == 10
+
+    # Keys saved in an older format, including before the header was pickled on its own, are rebuilt
+    for saved in (pickle.dumps({'format': 1, 'version': '0.1'}) + b'cvicta.removed\nKey\n.',
+                  b'cvicta.removed\nKey\n.'):
+        path.write_bytes(saved)
+        loaded = Key.cached(path, tmp_path / 'key.csv', 'Test key', tmp_path / 'rules.csv')
+        assert loaded.fingerprint == rebuilt.fingerprint
+        assert Key.load(path, rebuilt.fingerprint).ruleset[1].number == 10
+
+
+def test_reclassify(key, key_df, rules_df, records):
+    """Test only records that visited a changed couplet are reclassified"""
+    previous = pickle.loads(pickle.dumps(key.classify_table(records, 'id')))
+
+    rules_df.loc[3, 'VALUE'] = 'mallee'  # rule 4 is only used at couplet 2
+    key_df.loc[2, 'OUTPUT_NAME'] = 'Tall eucs'
+    edited = Key(key_df, 'Test key', rules_df)
+
+    changes = edited.diff(key)
+    assert changes.rules == {4}
+    assert changes.couplets == {2}
+    assert changes.renamed == {10}
+    assert list(changes.affected(previous)) == [False, False, False, True, True, True]
+    assert not Key(key_df, 'Test key', rules_df).diff(edited)
+
+    with pytest.raises(ValueError):
+        edited.reclassify(records.iloc[1:], previous, changes, 'id')
+
+    results = edited.reclassify(records, previous, changes, 'id')
+    assert results.to_frame().equals(edited.classify_table(records, 'id').to_frame())
+    assert list(results.names[:2]) == ['Tall eucs', 'Tall other']
+    assert list(results.classes[3:]) == [None, 21, None]  # "Mallee" now matches both rulesets at couplet 2
+
+
+def test_result_table_pickle(key, records):
+    """Test a table still has its couplets after a pickle round trip"""
+    table = key.classify_table(records, 'id')
+    loaded = pickle.loads(pickle.dumps(table))
+
+    assert loaded.steps().equals(table.steps())
+    assert loaded.path_table().equals(table.path_table())
+    assert str(loaded.error(3)) == str(table.error(3))
+    assert key.reclassify(records, loaded, key.diff(key), 'id').to_frame().equals(table.to_frame())
+
+
+def test_classify_errors(key, records):
+    with pytest.raises(ClassificationError):
+        key.classify(records.iloc[3].copy(), 'id')
+    with pytest.raises(MultipleMatchesError):
+        key.classify(records.iloc[4].copy(), 'id')
+
+
+def test_classify_missing_attributes(key, records):
+    with pytest.raises(MissingAttributeError, match='DESC'):
+        key.classify_table(records.drop(columns='desc'))
+    with pytest.raises(MissingAttributeError, match='DESC'):
+        key.classify_frame(records.drop(columns='desc'))
+
+
+def test_classify_table_errors(key, records):
+    """Test failures are recorded without raising and the messages match classify"""
+    table = key.classify_table(records, 'id')
+
+    errors = table.errors()
+    assert list(errors['ID']) == [4, 5]
+    assert list(errors['couplet']) == [2, 2]
+    assert errors['rulesets'].iloc[1] == ('4', '4 or 3')
+
+    for position in (3, 4):
+        with pytest.raises(VictaError) as err:
+            key.classify(records.iloc[position].copy(), 'id')
+        assert str(table.error(position)) == str(err.value)
+    assert table.error(0) is None
+
+
+def test_classify_frame(key, records):
+    """Test vectorised classification matches the scalar path"""
+    expected_result, expected_steps = classify_all(key, records)
+    result, steps = key.classify_frame(records, 'id', errors='ignore')
+
+    assert list(result.index) == [0, 1, 2, 5]
+    assert result.reset_index(drop=True).equals(expected_result.reset_index(drop=True))
+    assert steps.equals(expected_steps)
+
+
+def test_classify_frame_errors(key, records):
+    with pytest.raises(ClassificationError):
+        key.classify_frame(records, 'id')
+    with pytest.raises(MultipleMatchesError):
+        key.classify_frame(records.iloc[[0, 4, 3]], 'id')
+
+
+def test_compile(key, records):
+    """Test the compiled key matches the scalar path"""
+    compiled = key.compile()
+    assert 'def classify(record):' in compiled.source
+
+    for idx, record in records.iterrows():
+        try:
+            expected = key.classify(record.copy(), 'id')
+        except (ClassificationError, MultipleMatchesError) as err:
+            with pytest.raises(type(err), match=re.escape(str(err))):
+                compiled.classify(record.copy(), 'id')
+        else:
+            result, steps = compiled.classify(record.copy(), 'id')
+            assert result.equals(expected[0])
+            assert steps.equals(expected[1])
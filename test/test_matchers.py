@@ -0,0 +1,89 @@
+import pickle
+from collections import namedtuple
+import numpy as np
+from victa.matchers import group_rules, indexed, ThresholdIndex
+from victa.rules import Rule, RuleSet
+
+
+def test_group_rules():
+    """Test only text rules on the same attribute are grouped"""
+    ruleset = RuleSet({
+        1: Rule('euc', 'DESC', 'regex', 'Eucalypt'),
+        2: Rule('acacia', 'DESC', 'in', 'Acacia'),
+        3: Rule('5', 'DESC', '=', 'Number'),
+        4: Rule('tree', 'FORM', '=', 'Tree'),
+        5: Rule('5', 'HEIGHT', '>=', 'Tall'),
+        6: Rule('2', 'HEIGHT', '<', 'Short'),
+        7: Rule('tall', 'HEIGHT', '=', 'Tall text'),
+    })
+    matchers = group_rules(ruleset)
+    assert sorted(matchers) == [1, 2, 5, 6]
+    assert matchers[1] is matchers[2]
+    assert isinstance(matchers[5], ThresholdIndex) and matchers[5] is matchers[6]
+    assert group_rules(ruleset, min_rules=1)[4].rule_ids == (4,)
+
+    tests = indexed(ruleset, matchers)
+    assert tests[1] is ruleset[1] and tests[5] is not ruleset[5]
+
+
+def test_text_matcher():
+    """Test grouped rules give the same results as testing each rule"""
+    ruleset = RuleSet({
+        1: Rule('euc', 'DESC', 'regex', 'Eucalypt'),
+        2: Rule('acacia', 'DESC', 'in', 'Acacia'),
+        3: Rule('mallee', 'DESC', '=', 'Mallee'),
+        4: Rule('MALLEE', 'DESC', '=', 'Mallee again'),
+        5: Rule(r'(\w)\1', 'DESC', 'regex', 'Backreference'),
+        6: Rule('(?x) a c a', 'DESC', 'regex', 'Inline flag'),
+        7: Rule('', 'DESC', 'in', 'Empty'),
+        8: Rule('na', 'DESC', 'in', 'NaN'),
+    })
+    values = ['Eucalyptus regnans', ' mallee ', 'Acacia', 'tree', 5, np.nan, None, True]
+    matcher = group_rules(ruleset)[1]
+    for matcher in (matcher, pickle.loads(pickle.dumps(matcher))):
+        results = matcher.test_uniques(values)
+        for rule_id, rule in ruleset.items():
+            assert list(results[rule_id]) == [rule.test(value) for value in values]
+
+
+def test_threshold_index():
+    """Test indexed rules give the same results as testing each rule"""
+    ruleset = RuleSet({
+        1: Rule('5', 'HEIGHT', '>=', 'Tall'),
+        2: Rule('5', 'HEIGHT', '<', 'Short'),
+        3: Rule('2', 'HEIGHT', '>', 'Not tiny'),
+        4: Rule('2', 'HEIGHT', '<=', 'Tiny'),
+        5: Rule('5', 'HEIGHT', '=', 'Five'),
+        6: Rule('30.5', 'HEIGHT', '>', 'Very tall'),
+    })
+    values = [5, 5.0000000001, 4.9999, 2, 1, 31, '5.0', ' 2 ', 'abc', '', np.nan, 'nan', None, np.inf, -np.inf, True]
+    index = group_rules(ruleset)[1]
+    for index in (index, pickle.loads(pickle.dumps(index))):
+        results = index.test_uniques(values)
+        for rule_id, rule in ruleset.items():
+            expected = [rule.test(value) for value in values]
+            assert [index.test(value, rule_id) for value in values] == expected
+            assert list(results[rule_id]) == expected
+
+    numbers = np.array([-np.inf, 0, 2, 4.999999999999, 5, 5.0000000001, 6, np.inf, np.nan])
+    results = index.test_numbers(numbers)
+    for rule_id, rule in ruleset.items():
+        assert list(results[rule_id]) == [rule.test(n) for n in numbers]
+
+
+def test_threshold_index_nan():
+    """Test rules with a NaN value aren't indexed, as they would break the threshold order"""
+    ruleset = RuleSet({
+        1: Rule('1', 'C', '<=', 'Low'),
+        2: Rule('NAN', 'C', '<', 'Not a number'),
+        3: Rule('3', 'C', '>', 'High'),
+        4: Rule('0', 'C', '>=', 'Positive'),
+    })
+    matchers = group_rules(ruleset)
+    assert sorted(matchers) == [1, 3, 4]
+    tests = indexed(ruleset, matchers)
+    Record = namedtuple('Record', ['C'])
+    for value in [-1, 0, 0.5, 1, 2, 3, 4, np.nan, 'abc']:
+        assert [tests[i](Record(value)) for i in ruleset] == [rule.test(value) for rule in ruleset.values()]
+    results = matchers[1].test_uniques([0.5, 2, 4])
+    assert list(results[1]) == [True, False, False]
@@ -0,0 +1,31 @@
+import pickle
+import pandas as pd
+from victa.couplets import Couplet
+from victa.paths import PathStore
+
+
+def test_path_store():
+    """Test each distinct path is stored once"""
+    store = PathStore([(0, 1, 10), (0, 2)])
+    assert store.add((0, 2)) == 1
+    assert store.add((0, 1, 11)) == 2
+    assert len(store) == 3 and store[2] == (0, 1, 11) and (0, 2) in store
+    assert list(pickle.loads(pickle.dumps(store))) == list(store)
+    assert pickle.loads(pickle.dumps(store)).add((0, 2)) == 1
+
+
+def test_path_store_frames():
+    """Test couplet metadata is only joined on request"""
+    couplets = {0: Couplet(0, 'couplet', 'Key'), 2: Couplet(2, 'couplet', 'Non-trees'),
+                21: Couplet(21, 'class', 'Acacia or eucalypt shrub')}
+    store = PathStore([(0, 2), (0, 2, 21)])
+
+    assert list(store.to_frame().columns) == ['path_id', 'step', 'id']
+    frame = store.to_frame(couplets)
+    assert list(frame.columns) == ['path_id', 'step', 'id', 'type', 'name', 'comments']
+    assert isinstance(frame['name'].dtype, pd.CategoricalDtype)
+    assert list(frame['name'].cat.categories) == ['Acacia or eucalypt shrub', 'Key', 'Non-trees']
+
+    steps = store.join([1, 1, 0], couplets, categorical=False)
+    assert list(steps['position']) == [0, 0, 0, 1, 1, 1, 2, 2]
+    assert list(steps['id']) == [0, 2, 21, 0, 2, 21, 0, 2]
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+from victa.errors import MissingAttributeError
+from victa.records import accessor, normalise, project, infer_type, MappingRecord, Schema
+
+
+def test_normalise():
+    """Test column names are upper cased without modifying the records"""
+    records = pd.DataFrame({'Height': [1.0], 'form': ['tree']})
+    assert list(normalise(records).columns) == ['HEIGHT', 'FORM']
+    assert list(normalise(records.iloc[0]).index) == ['HEIGHT', 'FORM']
+    assert list(records.columns) == ['Height', 'form']
+
+
+def test_accessor():
+    """Test attribute values are read by upper case name from every kind of record"""
+    records = pd.DataFrame({'Height': [1.0], 'form': ['tree']}, index=[7])
+    for record, columns in [(records.iloc[0], None), ({'Height': 1.0, 'form': 'tree'}, None),
+                            (next(records.itertuples()), None), ((1.0, 'tree'), ['height', 'FORM'])]:
+        view = accessor(record, columns)(record)
+        assert (view.HEIGHT, view['FORM']) == (1.0, 'tree')
+        assert 'FORM' in view and 'form' not in view
+        with pytest.raises(AttributeError):
+            view.DESC
+
+    assert accessor(next(records.itertuples()))(next(records.itertuples())).name == 7
+    assert isinstance(accessor({})({'a': 1}), MappingRecord)
+
+
+def test_project():
+    """Test only the required columns are selected and missing columns are reported together"""
+    records = pd.DataFrame({'Height': [1.0], 'form': ['tree'], 'other': [0], 'id': [1]})
+    projected = project(records, ['HEIGHT', 'FORM'], 'ID')
+    assert list(projected.columns) == ['HEIGHT', 'FORM', 'ID']
+    assert list(records.columns) == ['Height', 'form', 'other', 'id']
+
+    with pytest.raises(MissingAttributeError) as err:
+        project(records, ['HEIGHT', 'DESC', 'COVER'])
+    assert err.value.attributes == ['DESC', 'COVER']
+
+
+def test_infer_type():
+    assert infer_type(pd.Series([1, 2, 3])) == 'numeric'
+    assert infer_type(pd.Series([1.5, np.nan])) == 'numeric'
+    assert infer_type(pd.Series([1.5], dtype=np.float32)) == 'mixed'
+    assert infer_type(pd.Series(['tree', 'shrub'])) == 'string'
+    assert infer_type(pd.Series(['tree', '5'])) == 'mixed'
+    assert infer_type(pd.Series(['tree', None])) == 'mixed'
+    assert infer_type(pd.Series(['tree', 5], dtype=object)) == 'mixed'
+
+
+def test_schema():
+    records = pd.DataFrame({'HEIGHT': [1.0], 'FORM': ['tree']})
+    schema = Schema(records, ['HEIGHT', 'FORM', 'FORM', 'MISSING'])
+    assert schema.types == {'HEIGHT': 'numeric', 'FORM': 'string'}
+    assert schema['MISSING'] == 'mixed'
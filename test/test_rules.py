@@ -1,6 +1,11 @@
+import pickle
 import pytest
+import numpy as np
+import pandas as pd
 from collections import namedtuple
-from victa.rules import Rule, RuleSet, RuleSyntaxError
+from victa.errors import ManadatoryFieldError, ValidationError
+from victa.matchers import group_rules
+from victa.rules import Rule, RuleMasks, RuleSet, RuleSyntaxError, build_rules, parse
 
 
 def test_ruleset1():
@@ -149,4 +154,85 @@ def test_rule_lt_le():
     assert rules.test(expr, testdata)
 
 
+def test_ruleset_compiled():
+    """Test expressions are only compiled once"""
+    assert parse('1 and not 2') is parse(' 1 and not 2')
 
+    rule = lambda x: True
+    ruleset = RuleSet({1: rule, 2: rule})
+    assert not ruleset.test(parse('1 and not 2'), 'None')
+
+
+def test_rule_text_comparisons():
+    """Test comparisons fall back to text when the value or rule value is not numeric"""
+    assert Rule('5', 'attribute', '>=', 'test rule1').test(' 10 ')
+    assert not Rule('5', 'attribute', '>=', 'test rule1').test('10 m')  # '10 M' < '5'
+    assert Rule('B', 'attribute', '>=', 'test rule1').test('c')
+    assert Rule('5', 'attribute', '=', 'test rule1').test('5.000')
+    assert Rule('abc', 'attribute', '=', 'test rule1').test(' Abc ')
+    assert not Rule('5', 'attribute', '<', 'test rule1').test(float('nan'))
+    assert Rule('tru', 'attribute', 'in', 'test rule1').test(True)
+
+
+def test_rule_pickle():
+    """Test rules can be pickled"""
+    rules = [Rule('[a-c]+d', 'attribute', 're', 'test rule1', 'comment'),
+             Rule('5.5', 'attribute', 'gt', 'test rule2')]
+    for rule in rules:
+        copy = pickle.loads(pickle.dumps(rule))
+        assert repr(copy) == repr(rule)
+        assert copy.comment == rule.comment
+        assert copy.test('ABCD 6') == rule.test('ABCD 6')
+        assert copy.specialise('string')('xyz') == rule.test('xyz')
+        assert pickle.loads(pickle.dumps(copy)).test('ABCD 6') == rule.test('ABCD 6')
+
+
+def test_rule_numbers():
+    """Test vectorised numeric comparisons match scalar comparisons"""
+    numbers = np.array([-np.inf, 0, 4.999999999999, 5, 5.0000000001, 6, np.inf, np.nan])
+    for operator in ('=', '>=', '>', '<=', '<'):
+        rule = Rule('5', 'attribute', operator, 'test rule')
+        assert list(rule.test_numbers(numbers)) == [rule.test(n) for n in numbers]
+
+
+def test_rule_mask_mixed_types():
+    """Test values that are equal but have different types or signs aren't tested as one value"""
+    values = [1, 1.0, '1', True, 0, -0.0, False, '-0', None, np.nan]
+    ruleset = RuleSet({
+        1: Rule(r'\.', 'C', 'regex', 'Decimal'),
+        2: Rule('^-', 'C', 'regex', 'Negative'),
+        3: Rule('TRUE', 'C', '=', 'True'),
+    })
+    records = pd.DataFrame({'C': pd.Series(values, dtype=object)})
+    masks = RuleMasks(ruleset, records, matchers=group_rules(ruleset))
+    for rule_id, rule in ruleset.items():
+        expected = [rule.test(value) for value in values]
+        assert list(rule.mask(records['C'])) == expected
+        assert list(masks(rule_id, np.arange(len(values)))) == expected
+
+    rule = ruleset[2]
+    assert list(rule.mask(pd.Series([0.0, -0.0, 1.0, -0.0]))) == [False, True, False, True]
+
+
+def test_build_rules_validation():
+    """Test every invalid row is reported at once"""
+    rules_df = pd.DataFrame([
+        (1, 'HEIGHT', '>=', '5', 'Tall', None),
+        (1, 'HEIGHT', '<', '5', 'Short', ''),
+        (2, 'FORM', 'like', 'tree', 'Tree', ''),
+        (3, 'DESC', 'regex', '(euc', 'Eucalypt', ''),
+        (4, 'DESC', 'in', None, 'Acacia', ''),
+    ], columns=['ID', 'ATTRIBUTE', 'OPERATOR', 'VALUE', 'NAME', 'COMMENTS'])
+
+    with pytest.raises(ManadatoryFieldError) as err:
+        build_rules(rules_df)
+    assert [row for row, problem in err.value.problems] == [1, 2, 3, 4]
+
+    with pytest.raises(ValidationError) as err:
+        build_rules(rules_df.iloc[:4])
+    assert not isinstance(err.value, ManadatoryFieldError)
+    assert 'Duplicate rule "ID" 1' in str(err.value)
+
+    ruleset = build_rules(rules_df.iloc[[0, 2]].assign(OPERATOR=['>=', '=']))
+    assert list(ruleset) == [1, 2]
+    assert ruleset[1].comment == ''
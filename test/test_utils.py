@@ -1,9 +1,27 @@
 # TODO
 # But at least this will check for syntax errors...
 
-from victa.utils import isclose
+import subprocess
+import sys
 import pytest
+from victa.storage import read_table
+from victa.utils import isclose
 
 
 def test_todo():
     pass
+
+
+def test_lazy_import():
+    """Test importing victa doesn't import pandas or networkx"""
+    code = 'import sys, victa; print(sorted({"pandas", "networkx"} & set(sys.modules)))'
+    assert subprocess.check_output([sys.executable, '-c', code]).decode().strip() == '[]'
+
+
+def test_read_table(tmp_path):
+    """Test text like 'NULL' and 'NA' isn't read as NaN"""
+    path = tmp_path / 'records.csv'
+    path.write_text('ID,FORM\n1,NULL\n2,NA\n3,\n')
+    records = read_table(str(path))
+    assert list(records['FORM'][:2]) == ['NULL', 'NA']
+    assert records['FORM'].isnull()[2]
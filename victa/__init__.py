@@ -14,16 +14,41 @@ __all__ = ['build_rules',
            'build_key',
            'ClassificationError',
            'MultipleMatchesError',
+           'MissingAttributeError',
            'Couplet',
            'Key',
+           'read_table',
            'Rule',
            'RuleSet',
            'RuleSyntaxError',
+           'ValidationError',
            ]
 
-from .couplets import Couplet
-from .errors import (RuleSyntaxError, ClassificationError, MultipleMatchesError)
-from .key import (Key, build_key)
-from .rules import (Rule, RuleSet, build_rules)
-from .utils import *  # ensure patches are applied
+from importlib import import_module
 
+from .errors import (RuleSyntaxError, ClassificationError, MultipleMatchesError, MissingAttributeError,
+                     ValidationError)
+
+# The submodules below import pandas (and networkx when graphs are built) which dominate startup time,
+# so they are only imported when one of their names is first used
+_LAZY = {
+    'build_key': 'key',
+    'build_rules': 'rules',
+    'Couplet': 'couplets',
+    'Key': 'key',
+    'read_table': 'storage',
+    'Rule': 'rules',
+    'RuleSet': 'rules',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(import_module('.' + _LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+
+Static analysis of a classification Key
+
+"""
+
+__all__ = ['exclusive', 'exclusive_couplets', 'ruleset_cost', 'rule_ids']
+
+import ast
+import math
+from itertools import combinations, product
+
+from .errors import RuleSyntaxError
+from .rules import parse
+
+# Rulesets referring to more rules than this aren't analysed, the truth table doubles with each rule
+MAX_RULES = 12
+
+# Relative cost of testing a rule, by operator
+COSTS = {'=': 1, '>=': 1, '>': 1, '<=': 1, '<': 1, 'in': 2, 'regex': 4}
+
+
+def exclusive_couplets(graph, ruleset):
+    """
+    Find the couplets whose rulesets are mutually exclusive, i.e. no record can match more than one of them.
+
+    Args:
+        graph (victa.key.KeyGraph): key
+        ruleset (victa.RuleSet): rules
+
+    Returns:
+        tuple: bool for each couplet index, True if the couplet's rulesets are proven to be mutually exclusive
+    """
+    return tuple(all(exclusive(graph.rulesets[a], graph.rulesets[b], ruleset)
+                     for a, b in combinations(graph.edges(node), 2))
+                 for node in range(len(graph)))
+
+
+def exclusive(expr_a, expr_b, ruleset):
+    """
+    Prove that no record can match both of two ruleset expressions
+
+    Every combination of results of the rules in the expressions that matches both expressions is
+    checked to see if any attribute value could produce it. Each attribute could be a number, NaN or text
+    and the comparison rules (:code:`=`, :code:`>=`, :code:`>`, :code:`<=` and :code:`<`) on an attribute
+    must have an overlapping range of values. :code:`in` and :code:`regex` rules are only analysed by their
+    use in the expressions, e.g. :code:`1` and :code:`not 1`.
+
+    The proof is conservative, False doesn't mean a record can match both expressions.
+
+    Args:
+        expr_a (str): ruleset expression, e.g. :code:`'1 and not 2'`
+        expr_b (str): ruleset expression
+        ruleset (victa.RuleSet): rules
+
+    Returns:
+        bool: True if the expressions are mutually exclusive
+    """
+    try:
+        ids = sorted(rule_ids(expr_a) | rule_ids(expr_b))
+        test_a, test_b = parse(expr_a), parse(expr_b)
+    except (RuleSyntaxError, TypeError):
+        return False
+
+    if len(ids) > MAX_RULES or not all(rule_id in ruleset for rule_id in ids):
+        return False
+
+    for results in product((False, True), repeat=len(ids)):
+        results = dict(zip(ids, results))
+        try:
+            if test_a(results.__getitem__) and test_b(results.__getitem__) and _possible(results, ruleset):
+                return False
+        except Exception:  # Not a simple expression of rule IDs
+            return False
+
+    return True
+
+
+def ruleset_cost(expr, ruleset):
+    """
+    Estimate the relative cost of testing a ruleset expression
+
+    Args:
+        expr (str): ruleset expression, e.g. :code:`'1 and not 2'`
+        ruleset (victa.RuleSet): rules
+
+    Returns:
+        int: sum of the cost of each rule, see victa.analysis.COSTS
+    """
+    try:
+        ids = rule_ids(expr)
+    except RuleSyntaxError:
+        return 0
+    return sum(COSTS.get(ruleset[r].operator, 1) if r in ruleset else 1 for r in ids)
+
+
+def _possible(results, ruleset):
+    """Could an attribute value produce these rule results, for every attribute"""
+    attributes = {}
+    for rule_id, result in results.items():
+        rule = ruleset[rule_id]
+        attributes.setdefault(rule.attribute, []).append((rule, result))
+
+    return all(_number(results) or _nan(results) or _text(results) for results in attributes.values())
+
+
+def _number(results):
+    """Could a number produce these rule results"""
+    interval = _Interval()
+    for rule, result in results:
+        if _text_equal(rule) and result:
+            return False  # A number is never equal to text that isn't a number
+        elif rule.number is None or rule.comparison is None:
+            continue  # Not tested as a number
+        elif math.isnan(rule.number):
+            if result:
+                return False  # Nothing compares equal to NaN
+        elif rule.operator == '=':
+            if result:  # Within the relative tolerance of victa.utils.isclose
+                tolerance = 0 if math.isinf(rule.number) else 2e-09 * abs(rule.number)
+                interval.lower(rule.number - tolerance, False)
+                interval.upper(rule.number + tolerance, False)
+        else:
+            interval.compare(rule.operator, rule.number, result)
+    return interval.possible()
+
+
+def _nan(results):
+    """Could NaN produce these rule results"""
+    return not any(result for rule, result in results
+                   if _text_equal(rule) or (rule.number is not None and rule.comparison is not None))
+
+
+def _text_equal(rule):
+    """Is the rule equality with text that isn't a number"""
+    return rule.operator == '=' and rule.number is None
+
+
+def _text(results):
+    """Could text (that isn't a number) produce these rule results"""
+    interval = _Interval()
+    for rule, result in results:
+        if rule.comparison is None:
+            continue  # in and regex
+        elif rule.operator == '=':
+            if result:
+                interval.lower(rule.value, False)
+                interval.upper(rule.value, False)
+        else:
+            interval.compare(rule.operator, rule.value, result)
+    return interval.possible()
+
+
+class _Interval(object):
+    """Range of values, of any ordered type, that satisfy some comparisons. None is unbounded"""
+
+    def __init__(self):
+        self.low, self.low_strict = None, False
+        self.high, self.high_strict = None, False
+
+    def lower(self, value, strict):
+        if self.low is None or value > self.low or (value == self.low and strict):
+            self.low, self.low_strict = value, strict
+
+    def upper(self, value, strict):
+        if self.high is None or value < self.high or (value == self.high and strict):
+            self.high, self.high_strict = value, strict
+
+    def compare(self, operator, value, result):
+        """Add the range for the result of :code:`attribute <operator> value`"""
+        if operator in ('>=', '>'):
+            if result:
+                self.lower(value, operator == '>')
+            else:
+                self.upper(value, operator == '>=')
+        elif operator in ('<=', '<'):
+            if result:
+                self.upper(value, operator == '<')
+            else:
+                self.lower(value, operator == '<=')
+
+    def possible(self):
+        if self.low is None or self.high is None or self.low < self.high:
+            return True
+        return self.low == self.high and not (self.low_strict or self.high_strict)
+
+
+class _RuleIds(ast.NodeVisitor):
+    """Collect the rule IDs in a ruleset expression"""
+
+    def __init__(self):
+        self.rule_ids = set()
+
+    # noinspection PyPep8Naming
+    def visit_Num(self, node):  # python < 3.8
+        self.rule_ids.add(node.n)
+
+    # noinspection PyPep8Naming
+    def visit_Constant(self, node):
+        if isinstance(node.value, (int, float, complex)):
+            self.rule_ids.add(node.value)
+
+
+def rule_ids(expr):
+    """
+    The rule IDs in a ruleset expression
+
+    Args:
+        expr (str): ruleset expression, e.g. :code:`'1 and not 2'`
+
+    Returns:
+        set: rule IDs
+
+    Raises:
+        RuleSyntaxError: if the expression is not valid python syntax
+    """
+    visitor = _RuleIds()
+    try:
+        visitor.visit(ast.parse(str(expr).strip(), mode='eval'))
+    except SyntaxError:
+        raise RuleSyntaxError('The ruleset expression "{}" is not valid python syntax'.format(expr))
+    return visitor.rule_ids
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+
+Classification result cache
+
+Records with the same values for every attribute referred to by the rules always get the same result,
+so the result is cached by those values and reused.
+
+"""
+
+__all__ = ['ResultCache', 'CacheInfo', 'cache_keys', 'cache_key']
+
+from collections import OrderedDict, namedtuple
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class ResultCache(object):
+    """
+    Least recently used cache of classification results
+
+    Args:
+        maxsize (int): maximum number of results to cache, 0 disables the cache
+
+    Attributes:
+        hits (int): number of results reused
+        misses (int): number of results not in the cache
+    """
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __getstate__(self):
+        # Cached results aren't worth sending to other processes
+        return {'maxsize': self.maxsize, 'hits': 0, 'misses': 0, '_results': OrderedDict()}
+
+    def get(self, values):
+        """
+        Get a cached result
+
+        Args:
+            values (tuple): cache key, see victa.cache.cache_keys
+
+        Returns:
+            The cached result or None
+        """
+        try:
+            result = self._results[values]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._results.move_to_end(values)
+        self.hits += 1
+        return result
+
+    def put(self, values, result):
+        """
+        Cache a result, discarding the least recently used result if the cache is full
+
+        Args:
+            values (tuple): cache key, see victa.cache.cache_keys
+            result: result to cache
+        """
+        if not self.maxsize:
+            return
+
+        self._results[values] = result
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        """Discard all cached results and reset the statistics"""
+        self._results.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        """
+        Cache statistics
+
+        Returns:
+            victa.cache.CacheInfo: hits, misses, maxsize and currsize, the same as functools.lru_cache
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._results))
+
+
+def cache_keys(records, attributes):
+    """
+    Cache keys of a DataFrame of records
+
+    The key is the type and value of each attribute, so values that compare equal but could be tested
+    differently by a rule (e.g. :code:`1` and :code:`1.0` with a regex) are kept distinct.
+    Floats and null values are keyed by their text representation, as :code:`0.0` and :code:`-0.0`
+    are equal but could be tested differently and :code:`NaN` is not equal to itself.
+
+    The keys are built from the same column values that victa.records.rows gives the rules.
+
+    Args:
+        records (pandas.DataFrame): records, with normalised column names
+        attributes (iterable): attributes (columns) referred to by the rules
+
+    Returns:
+        iterator: a tuple for each record
+    """
+    columns = []
+    for attribute in attributes:
+        if attribute not in records:
+            continue
+        values = records[attribute].to_numpy(dtype=object, copy=True)
+        types = list(map(type, values))
+        inexact = pd.isnull(values) | np.fromiter(map(issubclass, types, repeat(float)), bool, len(types))
+        values[inexact] = [repr(v) for v in values[inexact]]
+        columns.append(zip(types, values))
+    return zip(*columns) if columns else repeat((), len(records))
+
+
+def cache_key(record, attributes):
+    """
+    Cache key of a record, see victa.cache.cache_keys
+
+    Args:
+        record (pandas.Series): record, with normalised axis labels
+        attributes (iterable): attributes referred to by the rules
+
+    Returns:
+        tuple:
+    """
+    return tuple((type(v), repr(v) if isinstance(v, float) or pd.isnull(v) else v)
+                 for v in (record[a] for a in attributes if a in record))
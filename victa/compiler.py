@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+
+Compile a classification Key to a specialised python function
+
+"""
+
+__all__ = ['CompiledKey']
+
+import ast
+import linecache
+from itertools import count
+
+from .errors import ClassificationError, MultipleMatchesError, RuleSyntaxError
+from .key import _output
+from .records import accessor
+from .rules import RuleSetTransformer
+
+_filenames = count()
+
+
+class CompiledKey(object):
+    """
+    A classification Key compiled to a single python function of nested if/elif branches.
+
+    Couplets with a single parent are inlined in to their parent's branch, couplets with multiple parents
+    (or very deep couplets) get their own function. The decision path to each branch is known when the key
+    is compiled, so it is stored as a constant.
+
+    Each rule is tested at most once per record for all the rulesets that are always evaluated
+    (i.e. the first rule of each ruleset) and the rest are tested inline so :code:`and`/:code:`or`
+    still short circuit.
+
+    Args:
+        key (victa.Key): key to compile
+
+    Attributes:
+        source (str): generated python source code
+    """
+
+    max_depth = 20  # maximum number of couplets inlined in to one function
+
+    def __init__(self, key):
+        graph = key.graph
+        self.couplets = graph.couplets
+        self.edges = [[(graph.targets[edge], graph.rulesets[edge]) for edge in graph.edges(node)]
+                      for node in range(len(graph))]
+        self.root = graph.root
+        self.tests = key.tests
+
+        self._namespace = {'__builtins__': __builtins__}
+        self._functions = {}  # couplets that get their own function
+
+        self._parents = [0] * len(self.couplets)
+        for edges in self.edges:
+            for out_couplet, _ in edges:
+                self._parents[out_couplet] += 1
+
+        lines = ['def classify(record):']
+        lines += self._couplet(self.root, (None, (self.root,)), set(), 1, 0)
+        done = set()
+        while len(done) < len(self._functions):
+            node = min(set(self._functions) - done)
+            done.add(node)
+            lines += [''] + self._function(node)
+
+        self.source = '\n'.join(lines) + '\n'
+
+        filename = '<victa.compiled-{}>'.format(next(_filenames))
+        linecache.cache[filename] = (len(self.source), None, self.source.splitlines(True), filename)
+        exec(compile(self.source, filename, 'exec'), self._namespace)
+        self.function = self._namespace['classify']
+
+    def __call__(self, record):
+        """
+        Run the compiled function
+
+        Args:
+            record (pandas.Series): record to be classified, with upper case axis labels
+                or a view from victa.records.accessor
+
+        Returns:
+            tuple(int, tuple, tuple): index of the output class (or None), the indices of the couplets
+                that were traversed and the indices of the edges that matched if there were multiple matches
+        """
+        return self.function(record)
+
+    # noinspection PyShadowingNames
+    def classify(self, record, id_field=None, columns=None):
+        """
+        Classify a record, see victa.Key.classify
+
+        Args:
+            record (pandas.Series, mapping, namedtuple or sequence): record to be classified
+            id_field (str): column name to use as unique ID field
+            columns (sequence or mapping, optional): see victa.records.accessor
+
+        Returns:
+            tuple(pandas.Series, pandas.Dataframe): the output class and a the couplets that were traversed
+
+        Raises:
+            ClassificationError: When unable to classify a record
+            MultipleMatchesError: When a record matches multiple rulesets
+        """
+        record = accessor(record, columns)(record)
+        if id_field:
+            id_field = id_field.upper()
+
+        output, path, matches = self.function(record)
+        visited = [self.couplets[node] for node in path]
+
+        if output is not None:
+            return _output(visited, record, id_field)
+        elif matches:
+            edges = self.edges[path[-1]]
+            raise MultipleMatchesError(record, id_field, visited[-1], (edges[m][1] for m in matches))
+        else:
+            raise ClassificationError(record, id_field, visited)
+
+    def _function(self, node):
+        """Generate a function for a couplet"""
+        lines = ['def {}(record, path):'.format(self._functions[node]),
+                 # Stop infinite recursion through cycles in the key
+                 '    if len(path) > {}:'.format(len(self.couplets) * 2),
+                 '        return None, path, ()']
+        lines += self._couplet(node, ('path', ()), set(), 1, 0)
+        return lines
+
+    def _couplet(self, node, path, tested, indent, depth):
+        """Generate the branches for a couplet"""
+        pad = '    ' * indent
+        couplet = self.couplets[node]
+        lines = ['{}# {}: {}'.format(pad, couplet.id, couplet.name)]
+
+        edges = self.edges[node]
+        if not edges:
+            return lines + ['{}return None, {}, ()'.format(pad, _path(*path))]
+
+        # Rules that are always tested, i.e. the first rule in each ruleset
+        tested = set(tested)
+        exprs = []
+        for _, ruleset in edges:
+            expr = self._parse(ruleset)
+            rule_id = _first(expr)
+            if rule_id is not None and rule_id not in tested:
+                tested.add(rule_id)
+                lines += ['{}_v{} = {}(record)'.format(pad, _name(rule_id), self._rule(rule_id))]
+            exprs.append(expr)
+
+        matches = ['_m{}'.format(i) for i in range(len(edges))]
+        for match, expr in zip(matches, exprs):
+            lines += ['{}{} = {}'.format(pad, match, self._expr(expr, tested))]
+
+        if len(edges) > 1:
+            lines += ['{}if {} > 1:'.format(pad, ' + '.join(matches)),
+                      '{}    return None, {}, tuple(i for i, m in enumerate(({})) if m)'.format(
+                          pad, _path(*path), ', '.join(matches))]
+
+        for i, (match, (out_couplet, _)) in enumerate(zip(matches, edges)):
+            lines += ['{}{} {}:'.format(pad, 'if' if i == 0 else 'elif', match)]
+            lines += self._branch(out_couplet, path, tested, indent + 1, depth + 1)
+        lines += ['{}else:'.format(pad),
+                  '{}    return None, {}, ()'.format(pad, _path(*path))]
+
+        return lines
+
+    def _branch(self, node, path, tested, indent, depth):
+        """Generate the code for moving to a couplet"""
+        pad = '    ' * indent
+        base, nodes = path
+
+        if self.couplets[node].type == 'class':
+            return ['{}return {}, {}, ()'.format(pad, node, _path(base, nodes + (node,)))]
+
+        elif self._parents[node] > 1 or depth >= self.max_depth or node == self.root:
+            name = self._functions.setdefault(node, '_couplet{}'.format(node))
+            return ['{}return {}(record, {})'.format(pad, name, _path(base, nodes + (node,)))]
+
+        return self._couplet(node, (base, nodes + (node,)), tested, indent, depth)
+
+    def _rule(self, rule_id):
+        """Bind a rule to the namespace of the compiled function"""
+        name = '_r{}'.format(_name(rule_id))
+        if name not in self._namespace:
+            try:
+                self._namespace[name] = self.tests[rule_id]
+            except KeyError:
+                raise KeyError('Rule "{}" is not in the ruleset'.format(rule_id))
+        return name
+
+    def _expr(self, node, tested):
+        """Generate the source of a ruleset expression"""
+        if isinstance(node, ast.BoolOp):
+            op = ' and ' if isinstance(node.op, ast.And) else ' or '
+            return '({})'.format(op.join(self._expr(value, tested) for value in node.values))
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return '(not {})'.format(self._expr(node.operand, tested))
+        elif isinstance(node, _RuleId):
+            if node.rule_id in tested:
+                return '_v{}'.format(_name(node.rule_id))
+            return '{}(record)'.format(self._rule(node.rule_id))
+        elif isinstance(node, ast.Name):
+            return node.id  # Not a rule ID, raise a NameError when run, same as RuleSet.test
+        raise RuleSyntaxError('Unable to compile ruleset expression "{}"'.format(ast.dump(node)))
+
+    # noinspection PyMethodMayBeStatic
+    def _parse(self, expr):
+        try:
+            expr = ast.parse(str(expr).strip(), mode='eval')
+        except SyntaxError as err:
+            raise RuleSyntaxError('The ruleset expression "{}" is not valid python syntax, {}'.format(expr, err.msg))
+        return _RuleIdTransformer().visit(expr).body
+
+
+class _RuleId(ast.Name):
+    """Placeholder for a rule ID in an expression"""
+    def __init__(self, rule_id):
+        super(_RuleId, self).__init__(id=str(rule_id), ctx=ast.Load())
+        self.rule_id = rule_id
+
+
+class _RuleIdTransformer(RuleSetTransformer):
+    # noinspection PyMethodMayBeStatic
+    def visit_Num(self, node):
+        return _RuleId(node.n)
+
+
+def _first(node):
+    """The rule ID that is always tested when an expression is evaluated"""
+    if isinstance(node, ast.BoolOp):
+        return _first(node.values[0])
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return _first(node.operand)
+    elif isinstance(node, _RuleId):
+        return node.rule_id
+
+
+def _path(base, nodes):
+    """Generate the source of a decision path"""
+    if not nodes:
+        return base or '()'
+    nodes = repr(tuple(nodes))
+    return '{} + {}'.format(base, nodes) if base else nodes
+
+
+def _name(rule_id):
+    """Python identifier safe rule ID"""
+    return str(rule_id).replace('-', '_').replace('.', '_')
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+
+Differences between two versions of a classification Key
+
+A record's decision at a couplet only depends on the couplet's edges (RULES and OUTPUT_COUPLET/OUTPUT_CLASS)
+and the rules they refer to. If none of the couplets a record visited changed, the record follows the same
+path through the new key, so only the records whose path touched a changed couplet need to be reclassified,
+see victa.Key.reclassify.
+
+"""
+
+__all__ = ['KeyDiff', 'diff']
+
+import numpy as np
+
+from .analysis import rule_ids
+
+
+class KeyDiff(object):
+    """
+    Changes between two versions of a classification Key, see victa.diff.diff
+
+    Attributes:
+        rules (set): IDs of the rules that were added, removed or changed (attribute, operator or value)
+        edges (set): (INPUT_COUPLET, RULES, OUTPUT) edges that were added or removed, rulesets are whitespace
+            normalised
+        couplets (set): IDs of the couplets where a record's decision could be different,
+            because an edge out of the couplet, or a rule an edge refers to, changed. Couplets that were removed
+            are included
+        renamed (set): IDs of the couplets that only had their name, type or comments changed,
+            these don't affect any decisions
+    """
+    def __init__(self, rules, edges, couplets, renamed):
+        self.rules = rules
+        self.edges = edges
+        self.couplets = couplets
+        self.renamed = renamed
+
+    def __bool__(self):
+        return bool(self.rules or self.edges or self.couplets or self.renamed)
+
+    def __repr__(self):
+        return 'KeyDiff(rules={}, edges={}, couplets={}, renamed={})'.format(
+            sorted(self.rules, key=str), len(self.edges), sorted(self.couplets, key=str), sorted(self.renamed, key=str))
+
+    def affected(self, results):
+        """
+        The records whose decision path touched a changed couplet
+
+        Args:
+            results (victa.results.ResultTable): results from the old key
+
+        Returns:
+            numpy.ndarray: boolean mask, one element per record
+        """
+        touched = np.array([not self.couplets.isdisjoint(path) for path in results.paths] + [True], dtype=bool)
+        return touched[results.path_ids]
+
+
+def diff(old, new):
+    """
+    Compare two versions of a classification Key
+
+    Args:
+        old (victa.Key): previous version
+        new (victa.Key): current version
+
+    Returns:
+        victa.diff.KeyDiff:
+    """
+    rules = {rule_id for rule_id in set(old.ruleset) | set(new.ruleset)
+             if _rule(old.ruleset.get(rule_id)) != _rule(new.ruleset.get(rule_id))}
+
+    old_edges, new_edges = _edges(old.graph), _edges(new.graph)
+    edges = set()
+    couplets = set()
+    for couplet_id in set(old_edges) | set(new_edges):
+        before, after = old_edges.get(couplet_id), new_edges.get(couplet_id)
+        if before != after:
+            edges.update((before or set()) ^ (after or set()))
+            couplets.add(couplet_id)
+        elif after and any(rules.intersection(rule_ids(ruleset)) for _, ruleset, _ in after):
+            couplets.add(couplet_id)
+
+    old_couplets = dict(zip(old.graph.ids, old.graph.couplets))
+    new_couplets = dict(zip(new.graph.ids, new.graph.couplets))
+    couplets.update(set(old_couplets) - set(new_couplets))
+    renamed = {couplet_id for couplet_id, couplet in new_couplets.items()
+               if couplet_id in old_couplets and couplet != old_couplets[couplet_id]} - couplets
+
+    return KeyDiff(rules, edges, couplets, renamed)
+
+
+def _rule(rule):
+    """What a rule tests, ignoring its name and comments"""
+    if rule is None:
+        return None
+    return rule.attribute, rule.operator, getattr(rule.value, 'pattern', rule.value)
+
+
+def _edges(graph):
+    """(INPUT_COUPLET, RULES, OUTPUT) edges out of each couplet, by couplet ID"""
+    edges = {}
+    for node, couplet_id in enumerate(graph.ids):
+        edges[couplet_id] = {(couplet_id, ' '.join(graph.rulesets[edge].split()), graph.ids[graph.targets[edge]])
+                             for edge in graph.edges(node)}
+    return edges
@@ -7,11 +7,14 @@ class ClassificationError(VictaError, RuntimeError):
     """ Custom Exception raised when classification of a record fails """
     def __init__(self, record, id_field, steps):
         self.record = record
+        self.id_field = id_field
         self.steps = steps
+        super(ClassificationError, self).__init__(record, id_field, steps)
 
-        msg = 'Unable to classify record "{}={}". Visited couplets ("{}")'
-        msg = msg.format(id_field, record[id_field], '", "'.join((str(c.id) for c in steps)))
-        super(ClassificationError, self).__init__(msg)
+    def __str__(self):
+        # The message is only formatted when it's needed
+        msg = 'Unable to classify record "{}". Visited couplets ("{}")'
+        return msg.format(_record_id(self.record, self.id_field), '", "'.join((str(c.id) for c in self.steps)))
 
 
 class MultipleMatchesError(VictaError, RuntimeError):
@@ -19,12 +22,15 @@ class MultipleMatchesError(VictaError, RuntimeError):
 
     def __init__(self, record, id_field, couplet, rulesets):
         self.record = record
+        self.id_field = id_field
         self.couplet = couplet
-        self.rulesets = rulesets
+        self.rulesets = tuple(rulesets)
+        super(MultipleMatchesError, self).__init__(record, id_field, couplet, self.rulesets)
 
-        msg = 'Record "{}={}" matches multiple rulesets for couplet "{}" ("{}")'
-        msg = msg.format(id_field, record[id_field], couplet.id, '", "'.join(rulesets))
-        super(MultipleMatchesError, self).__init__(msg)
+    def __str__(self):
+        # The message is only formatted when it's needed
+        msg = 'Record "{}" matches multiple rulesets for couplet "{}" ("{}")'
+        return msg.format(_record_id(self.record, self.id_field), self.couplet.id, '", "'.join(self.rulesets))
 
 
 class RuleSyntaxError(VictaError, SyntaxError):
@@ -32,7 +38,41 @@ class RuleSyntaxError(VictaError, SyntaxError):
     pass
 
 
-class ManadatoryFieldError(VictaError, ValueError):
+class MissingAttributeError(VictaError, ValueError):
+    """ Custom Exception raised when records don't have all the attributes referred to by the rules """
+    def __init__(self, attributes):
+        self.attributes = attributes
+        msg = 'Records are missing the attributes ("{}")'.format('", "'.join(str(a) for a in attributes))
+        super(MissingAttributeError, self).__init__(msg)
+
+
+class StaleKeyError(VictaError, ValueError):
+    """ Custom Exception raised when a saved Key is out of date """
+    pass
+
+
+class ValidationError(VictaError, ValueError):
+    """ Custom Exception raised when Key/Rule building fails, with every problem that was found """
+    def __init__(self, problems, table='key'):
+        if isinstance(problems, str):
+            problems = [(None, problems)]
+        self.problems = list(problems)  # (row label or None, message)
+        self.table = table
+        super(ValidationError, self).__init__(self.problems, table)
+
+    def __str__(self):
+        msg = ['Invalid {} ({} problem{})'.format(self.table, len(self.problems), '' if len(self.problems) == 1 else 's')]
+        msg += ['    {}{}'.format('' if row is None else 'row {}: '.format(row), problem) for row, problem in self.problems]
+        return '\n'.join(msg)
+
+
+class ManadatoryFieldError(ValidationError):
     """ Custom Exception raised when Key/Rule building fails because of empty fields"""
     pass
 
+
+def _record_id(record, id_field):
+    """Identify a record in an error message"""
+    if id_field:
+        return '{}={}'.format(id_field, record[id_field])
+    return record.name
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+
+Classification instrumentation
+
+Counters and timings collected while classifying records, see victa.Key.instrument
+
+"""
+
+__all__ = ['Instrumentation']
+
+from time import perf_counter
+
+import pandas as pd
+
+
+class Instrumentation(object):
+    """
+    Per rule, per couplet and per edge counters and timings
+
+    Rules are timed by wrapping each rule test, so the timings include a small overhead
+    but the tests aren't wrapped at all unless instrumentation is enabled.
+
+    Args:
+        graph (victa.key.KeyGraph): key
+        ruleset (victa.RuleSet): rules
+
+    Attributes:
+        visits (list): number of times each couplet index was visited
+        hits (list): number of times each edge matched
+    """
+    def __init__(self, graph, ruleset):
+        self.graph = graph
+        self.ruleset = ruleset
+        self.visits = [0] * len(graph)
+        self.hits = [0] * len(graph.targets)
+
+        self._rules = {}  # rule ID: [evaluations, true, seconds]
+        self._tests = None
+        self._timed = None
+
+    def reset(self):
+        """Set all the counters and timings to zero"""
+        self.__init__(self.graph, self.ruleset)
+
+    def wrap(self, tests):
+        """
+        Wrap rule tests so they're counted and timed
+
+        Args:
+            tests (victa.RuleSet or dict): rules to test, or specialised tests from victa.RuleSet.specialise
+
+        Returns:
+            dict: :code:`test(record)` function for each rule ID, can be passed to victa.rules.RuleResults
+        """
+        if tests is not self._tests:
+            self._tests = tests
+            self._timed = {rule_id: self._time(rule_id, test) for rule_id, test in tests.items()}
+        return self._timed
+
+    def _time(self, rule_id, test):
+        stats = self._rules.setdefault(rule_id, [0, 0, 0.0])
+
+        def timed(record):
+            start = perf_counter()
+            result = test(record)
+            stats[2] += perf_counter() - start
+            stats[0] += 1
+            stats[1] += bool(result)
+            return result
+
+        return timed
+
+    def rules(self):
+        """
+        Rule statistics
+
+        Returns:
+            pandas.DataFrame: ID, ATTRIBUTE, OPERATOR, EVALUATIONS, TRUE_RATE and SECONDS (cumulative) for each rule
+        """
+        rows = []
+        for rule_id, rule in self.ruleset.items():
+            evaluations, true, seconds = self._rules.get(rule_id, (0, 0, 0.0))
+            rows.append((rule_id, rule.attribute, rule.operator, evaluations,
+                         true / evaluations if evaluations else float('nan'), seconds))
+        return pd.DataFrame.from_records(
+            rows, columns=['ID', 'ATTRIBUTE', 'OPERATOR', 'EVALUATIONS', 'TRUE_RATE', 'SECONDS'])
+
+    def couplets(self):
+        """
+        Couplet statistics
+
+        Returns:
+            pandas.DataFrame: COUPLET, NAME and VISITS for each couplet
+        """
+        graph = self.graph
+        return pd.DataFrame({'COUPLET': list(graph.ids),
+                             'NAME': [c.name if c else None for c in graph.couplets],
+                             'VISITS': self.visits})
+
+    def edges(self):
+        """
+        Edge statistics, in the same layout as victa.Key.profile
+
+        Returns:
+            pandas.DataFrame: INPUT_COUPLET, OUTPUT_COUPLET, RULES and HITS for each edge
+        """
+        graph = self.graph
+        return pd.DataFrame({'INPUT_COUPLET': [graph.ids[node] for node in range(len(graph))
+                                               for _ in graph.edges(node)],
+                             'OUTPUT_COUPLET': [graph.ids[t] for t in graph.targets],
+                             'RULES': list(graph.rulesets),
+                             'HITS': self.hits})
@@ -9,8 +9,14 @@ TODO:
 
 __all__ = ['build_key', 'Key']
 
+import marshal
+import pickle
+import sys
+import numpy as np
 import pandas as pd
-import networkx as nx
+from collections import OrderedDict
+from itertools import repeat
+from types import FunctionType
 
 
 # TODO - decide plotting software and implement it properly, graphviz is a pain to install and uggghhhly
@@ -25,15 +31,26 @@ import networkx as nx
 # from victa.utils import _which
 # pygraphviz.agraph.AGraph._which = _which
 
-from .rules import build_rules
+from .rules import build_rules, parse, RuleMasks, RuleResults
 from .couplets import Couplet
-from .errors import ClassificationError, MultipleMatchesError, ManadatoryFieldError
+from .errors import ClassificationError, MultipleMatchesError, ManadatoryFieldError, StaleKeyError, ValidationError
+from .analysis import exclusive_couplets, rule_ids, ruleset_cost
+from .cache import ResultCache, cache_key, cache_keys
+from .diff import diff
+from .instrument import Instrumentation
+from .matchers import group_rules, indexed
+from .records import accessor, normalise, project, rows, Schema
+from .results import ResultTable, CLASSIFIED, UNCLASSIFIED, MULTIPLE_MATCHES
+from . import storage
+
+# classify_frame status of records that are still being classified
+_ACTIVE = -1
 
 
 class Key(object):
     """ Classification Key """
 
-    def __init__(self, key_df, key_desc, rules_df):
+    def __init__(self, key_df, key_desc, rules_df, cache_size=65536, first_match=False):
         """
          Build a Classification Key
 
@@ -41,28 +58,200 @@ class Key(object):
              key_df (pandas.DataFrame): see victa.key.build_key
              key_desc (str): see victa.key.build_key
              rules_df (pandas.DataFrame): see victa.key.build_rules
+             cache_size (int): maximum number of distinct attribute value combinations to cache
+                classification results for, 0 disables the cache. See victa.cache.ResultCache
+             first_match (bool): stop testing a couplet's rulesets at the first match if they are proven to be
+                mutually exclusive, see victa.analysis.exclusive
          """
         # Make all column headers upper case, as sqlalchemy columns are returned lower,
         # cx_oracle are upper and csv/excel could be any case
         rules_df.columns = rules_df.columns.str.upper()
         key_df.columns = key_df.columns.str.upper()
 
+        # Used to check if a saved key is out of date, see victa.Key.cached
+        self.fingerprint = storage.fingerprint(key_df, key_desc, rules_df)
+
         self.ruleset = build_rules(rules_df)
-        self.key = build_key(key_df, key_desc)
+        self.graph = _build_graph(key_df, key_desc)
+
+        # Attributes (record columns) referred to by the rules, upper case
+        self.attributes = tuple(sorted({rule.attribute for rule in self.ruleset.values()}))
+        _check_rules(self.graph, self.ruleset)
+        self.first_match = first_match
+        self._key = None
+
+        # Rules on the same attribute are tested together, see victa.matchers
+        self.matchers = group_rules(self.ruleset)
+        self._tests = None
+
+        # Opt-in counters and timings, see victa.Key.instrument
+        self.instrumentation = None
+
+        # Number of rule tests saved by reusing results within a record
+        self.rule_cache_hits = 0
+
+        # Results reused between records with the same values for all attributes the rules refer to
+        self.cache = ResultCache(cache_size)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_key'] = None  # rebuilt on request
+        state['_tests'] = None  # closures can't be pickled, rebuilt on request
+        state['instrumentation'] = None  # wrapped rule tests can't be pickled
+        return state
+
+    def save(self, path):
+        """
+        Save the built key to a file so it can be loaded without rebuilding it, see victa.Key.load
+
+        Args:
+            path (str): file path
+        """
+        storage.save(self, path)
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        """
+        Load a key saved by victa.Key.save
+
+        Saved keys are pickles, only load files from a trusted source.
+
+        Args:
+            path (str): file path
+            fingerprint (str, optional): fingerprint the key must have, see victa.storage.fingerprint
+
+        Returns:
+            victa.Key:
+
+        Raises:
+            StaleKeyError: if the key was saved by a different version of victa or its fingerprint doesn't match
+        """
+        return storage.load(path, fingerprint)
+
+    @classmethod
+    def cached(cls, path, key_df, key_desc, rules_df, cache_size=65536, first_match=False):
+        """
+        Load a saved key if it was built from the same key and rules, otherwise build it and save it.
+
+        The key and rules can be file paths (excel or csv), which are only read if the key needs to be rebuilt.
+
+        Args:
+            path (str): saved key file path
+            key_df (pandas.DataFrame or str): see victa.key.build_key, or the path to a file containing it
+            key_desc (str): see victa.key.build_key
+            rules_df (pandas.DataFrame or str): see victa.rules.build_rules, or the path to a file containing them
+            cache_size (int): see victa.Key
+            first_match (bool): see victa.Key
+
+        Returns:
+            victa.Key:
+        """
+        expected = storage.fingerprint(key_df, key_desc, rules_df)
+        try:
+            key = cls.load(path, expected)
+            key.cache = ResultCache(cache_size)
+            key.first_match = first_match
+            return key
+        # Keys saved before the header was pickled on its own can refer to classes that have since changed
+        except (OSError, EOFError, StaleKeyError, pickle.UnpicklingError, AttributeError, ImportError):
+            pass
+
+        if not isinstance(key_df, pd.DataFrame):
+            key_df = storage.read_table(key_df)
+        if not isinstance(rules_df, pd.DataFrame):
+            rules_df = storage.read_table(rules_df)
+
+        key = cls(key_df, key_desc, rules_df, cache_size, first_match)
+        key.fingerprint = expected  # of the files, if the key and rules were read from files
+        key.save(path)
+        return key
+
+    @property
+    def key(self):
+        """
+        NetworkX DiGraph containing couplets (nodes) joined by rules (edges), see victa.key.build_key
+
+        The graph is only built when first requested, classification uses the compact
+        victa.key.KeyGraph representation.
+
+        Returns:
+            key: nx.DiGraph
+        """
+        if self._key is None:
+            self._key = self.graph.to_networkx()
+        return self._key
+
+    @property
+    def tests(self):
+        """
+        Rule tests for single records, numeric rules on the same attribute share a threshold index,
+        see victa.matchers.indexed
+
+        Returns:
+            dict: :code:`test(record)` function for each rule ID, can be passed to victa.rules.RuleResults
+        """
+        if self._tests is None:
+            self._tests = indexed(self.ruleset, self.matchers)
+        return self._tests
+
+    @property
+    def exclusive(self):
+        """
+        Couplets whose rulesets are proven to be mutually exclusive, only worked out on first use
+        (e.g. when :code:`first_match=True`) as proving it can take longer than building the key
+
+        Returns:
+            tuple: bool for each couplet index, see victa.analysis.exclusive_couplets
+        """
+        if self.graph.exclusive is None:
+            self.graph.exclusive = exclusive_couplets(self.graph, self.ruleset)
+        return self.graph.exclusive
+
+    def cache_info(self):
+        """
+        Result cache statistics
+
+        Returns:
+            victa.cache.CacheInfo: hits, misses, maxsize and currsize
+        """
+        return self.cache.info()
+
+    def instrument(self, enabled=True):
+        """
+        Enable or disable the collection of per rule, per couplet and per edge counters and timings
+
+        Records classified by classify, classify_iter, classify_table and classify_stream are counted.
+        classify_frame counts couplet visits and edge hits but not rule tests, as rules are tested against
+        whole columns. Records that reuse a cached result (see victa.cache.ResultCache) aren't traversed so
+        aren't counted, use :code:`cache_size=0` to count every record.
+
+        Args:
+            enabled (bool): enable instrumentation, the counters are reset when enabled
+
+        Returns:
+            victa.instrument.Instrumentation: or None when disabled
+        """
+        self.instrumentation = Instrumentation(self.graph, self.ruleset) if enabled else None
+        return self.instrumentation
 
     # noinspection PyShadowingNames
-    def classify(self, record, id_field=None):
+    def classify(self, record, id_field=None, lightweight=False, columns=None):
         """
         Classify a record
 
         Args:
-            record (pandas.Series): record to be classified
-                record needs to contain all columns (Series axis labels) referred to in the :code:`Rule`.
-                See victa.rules.build_rules
+            record (pandas.Series, mapping, namedtuple or sequence): record to be classified
+                record needs to contain all columns (Series axis labels, keys or fields) referred to in the
+                :code:`Rule`. See victa.rules.build_rules and victa.records.accessor
             id_field (str): column name to use as unique ID field
+            lightweight (bool): return plain Couplet objects instead of pandas objects
+            columns (sequence or mapping, optional): column names of a sequence record,
+                see victa.records.accessor
 
         Returns:
             tuple(pandas.Series, pandas.Dataframe): the output class and a the couplets that were traversed
+                or if :code:`lightweight=True`, tuple(victa.Couplet, tuple): the output class and
+                the IDs of the couplets that were traversed
 
         Raises:
             ClassificationError: When unable to classify a record
@@ -71,54 +260,228 @@ class Key(object):
             - figure out a better way to stop infinite recursion
             - decide return data model
         """
-
-        visited = [self.key.root]
-
-        # Make all column headers upper case, as sqlalchemy columns are returned lower,
-        # cx_oracle are upper and csv/excel could be any case
-        record.rename(lambda i: i.upper(), inplace=True)  # record will be a pandas Series
         if id_field:
             id_field = id_field.upper()
 
+        record = accessor(record, columns)(record)
+        values = cache_key(record, self.attributes) if self.cache.maxsize else None
+        status, path, matches = self._classify_cached(values, record, self.tests)
+        if status != CLASSIFIED:
+            raise self._error(status, path, matches, record, id_field)
+
+        if lightweight:
+            return self.graph.couplets[path[-1]], tuple(self.graph.ids[node] for node in path)
+        return _output([self.graph.couplets[node] for node in path], record, id_field)
+
+    def _classify(self, record, tests):
+        """
+        Classify a record with normalised column names, see victa.Key.classify
+
+        Args:
+            record (pandas.Series): record to be classified
+            tests (victa.RuleSet or dict): rule tests, see victa.rules.RuleResults
+
+        Returns:
+            tuple(int, list, list): the status (see victa.results.ResultTable), the indices of the couplets that
+                were traversed (the last is the output class if the record was classified) and the
+                indices of the edges that matched at the last couplet
+        """
+        graph = self.graph
+        node = graph.root
+        path = [node]
+
+        stats = self.instrumentation
+        if stats is not None:
+            tests = stats.wrap(tests)
+
+        # Each rule is only tested once per record
+        results = RuleResults(tests, record)
+        exclusive = self.exclusive if self.first_match else None
+
         # TODO figure out a better way to stop infinite recursion
         # while True:
-        for i in range(len(self.key.node)*2):
+        for i in range(len(graph.couplets)*2):
 
-            matches = []
-            for in_couplet, out_couplet, rules in self.key.edges(visited[-1].id, data=True):
+            # Multiple matches aren't possible if the rulesets are mutually exclusive
+            first_match = exclusive is not None and exclusive[node]
 
-                couplet = self.key.node[out_couplet]['couplet']
-                if self.ruleset.test(rules['ruleset'], record):
-                    matches.append((couplet, rules['ruleset']))
-
-            if len(matches) == 1:
-                couplet, _ = matches[0]
-                visited += [couplet]
+            matches = []
+            for edge in range(graph.offsets[node], graph.offsets[node + 1]):
+                if self.ruleset.test(graph.compiled[edge], record, results):
+                    matches.append(edge)
+                    if first_match:
+                        break
 
-                if couplet.type == 'class':
-                    # TODO decide return data model:
-                    # tuple(pandas.Series, pandas.Dataframe), tuple(Couplet, list), etc...?
+            self.rule_cache_hits += results.hits
+            results.hits = 0
 
-                    # return couplet, visited
-                    result = couplet.to_series()   # Series
-                    steps = pd.DataFrame(visited)  # Dataframe
-                    steps = steps.assign(step=steps.index)
+            if stats is not None:
+                stats.visits[node] += 1
+                for edge in matches:
+                    stats.hits[edge] += 1
 
-                    if id_field:
-                        result.loc[id_field] = record[id_field]
-                        steps = steps.assign(**{id_field: record[id_field]})
+            if len(matches) == 1:
+                node = graph.targets[matches[0]]
+                path.append(node)
 
-                    return result, steps
+                if graph.couplets[node].type == 'class':
+                    return CLASSIFIED, path, matches
 
                 else:
                     continue
 
             elif len(matches) > 1:
-                rulesets = (cr[1] for cr in matches)
-                raise MultipleMatchesError(record, id_field, visited[-1], rulesets)
+                return MULTIPLE_MATCHES, path, matches
 
             else:
-                raise ClassificationError(record, id_field, visited)
+                return UNCLASSIFIED, path, matches
+
+        return UNCLASSIFIED, path, []
+
+    def _classify_cached(self, values, record, tests):
+        """
+        Classify a record, reusing the result for a previous record with the same values
+
+        Args:
+            values (tuple): cache key, see victa.cache.cache_keys. Or None to classify the record without the cache
+            record (pandas.Series, victa.records.MappingRecord or victa.records.SequenceRecord): record to be classified
+            tests: see victa.Key._classify
+
+        Returns:
+            tuple(int, list, list): see victa.Key._classify
+        """
+        if values is None:  # cache disabled
+            return self._classify(record, tests)
+
+        result = self.cache.get(values)
+        if result is None:
+            result = self._classify(record, tests)
+            self.cache.put(values, result)
+        return result
+
+    def _error(self, status, path, matches, record, id_field):
+        """
+        Build the exception for a record that couldn't be classified
+
+        Args:
+            status (int): record status, see victa.Key._classify
+            path (list): indices of the couplets that were traversed
+            matches (list): indices of the edges that matched at the last couplet
+            record (pandas.Series): record that was classified
+            id_field (str): upper case column name to use as unique ID field
+
+        Returns:
+            ClassificationError or MultipleMatchesError:
+        """
+        graph = self.graph
+        if status == MULTIPLE_MATCHES:
+            rulesets = (graph.rulesets[edge] for edge in matches)
+            return MultipleMatchesError(record, id_field, graph.couplets[path[-1]], rulesets)
+        return ClassificationError(record, id_field, [graph.couplets[node] for node in path])
+
+    def compile(self):
+        """
+        Compile the key to a single specialised python function.
+
+        The couplets are turned into nested if/elif branches with the rule tests inlined,
+        so classifying a record is a single function call. The generated source is available
+        as :code:`CompiledKey.source` for auditing.
+
+        The key is compiled as it is now, later changes to the key or ruleset are not reflected
+        in the compiled key.
+
+        Returns:
+            victa.compiler.CompiledKey:
+        """
+        from .compiler import CompiledKey
+        return CompiledKey(self)
+
+    def profile(self, records):
+        """
+        Count how often each edge (ruleset) out of each couplet matches a sample of records.
+
+        The profile can be saved (e.g. :code:`profile.to_csv(...)`) and applied to the key in later runs
+        with victa.Key.apply_profile
+
+        Args:
+            records (pandas.DataFrame): sample of records
+                records need to contain all columns (DataFrame axis labels) referred to in the :code:`Rule`s
+                see victa.key.build_rules
+
+        Returns:
+            pandas.DataFrame: INPUT_COUPLET, OUTPUT_COUPLET, RULES and MATCHES (number of records) for each edge
+        """
+        graph = self.graph
+        table = self.classify_table(records)
+
+        matches = np.zeros(len(graph.targets), dtype=np.int64)
+        for path, count in zip(table.paths, np.bincount(table.path_ids, minlength=len(table.paths))):
+            nodes = [graph.index[c] for c in path]
+            for node, target in zip(nodes[:-1], nodes[1:]):
+                edge = next(e for e in graph.edges(node) if graph.targets[e] == target)
+                matches[edge] += count
+
+        inputs = [graph.ids[node] for node in range(len(graph)) for _ in graph.edges(node)]
+        return pd.DataFrame({'INPUT_COUPLET': inputs,
+                             'OUTPUT_COUPLET': [graph.ids[t] for t in graph.targets],
+                             'RULES': list(graph.rulesets),
+                             'MATCHES': matches})
+
+    def apply_profile(self, profile):
+        """
+        Reorder the edges out of each couplet whose rulesets are mutually exclusive (see victa.analysis.exclusive)
+        so the most frequently matched rulesets are tested first, then the cheapest.
+
+        The output of the key doesn't change, only the number of rules tested when :code:`first_match=True`.
+        The order of other couplets' edges is kept so multiple matches are still reported in the same order.
+
+        Args:
+            profile (pandas.DataFrame): see victa.Key.profile
+        """
+        profile = normalise(profile)
+        counts = {(i, o): m for i, o, m in zip(profile['INPUT_COUPLET'], profile['OUTPUT_COUPLET'], profile['MATCHES'])}
+
+        graph, exclusive = self.graph, self.exclusive
+        order = []
+        for node in range(len(graph)):
+            edges = list(graph.edges(node))
+            if exclusive[node]:
+                edges.sort(key=lambda e: (-counts.get((graph.ids[node], graph.ids[graph.targets[e]]), 0),
+                                          ruleset_cost(graph.rulesets[e], self.ruleset)))
+            order += edges
+        graph.reorder(order)
+
+        # Cached results, instrumentation and the networkx graph refer to the old edge order
+        self.cache.clear()
+        self._key = None
+        if self.instrumentation is not None:
+            self.instrumentation.reset()
+
+    def classify_parallel(self, records, id_field=None, workers=None, chunksize=10000):
+        """
+        Classify a DataFrame of records in parallel, using a pool of worker processes
+
+        The records are split into chunks which are classified by the workers and the results are
+        merged back in the original order. The key is only sent to each worker process once.
+
+        Args:
+            records (pandas.DataFrame): records to be classified
+                records need to contain all columns (DataFrame axis labels) referred to in the :code:`Rule`s
+                see victa.key.build_rules
+            id_field (str): column name to use as unique ID field
+            workers (int, optional): number of worker processes, default is the number of CPUs
+            chunksize (int, optional): number of records sent to a worker at a time
+
+        Returns:
+            victa.results.ResultTable: results, including records that couldn't be classified
+
+        Raises:
+            MissingAttributeError: When records don't have all the attributes referred to by the rules
+        """
+        from .parallel import classify_parallel
+        if self.first_match:
+            self.exclusive  # work it out once, rather than in every worker
+        return classify_parallel(self, records, id_field, workers, chunksize)
 
     def classify_iter(self, records, id_field=None):
         """
@@ -133,17 +496,267 @@ class Key(object):
                 that were traversed and the input record
         Notes:
             Will yield tuple(None, None, pandas.Series) on ClassificationError, MultipleMatchesError
+
+        Raises:
+            MissingAttributeError: When records don't have all the attributes referred to by the rules
         """
+        if id_field:
+            id_field = id_field.upper()
 
-        for idx, record in records.iterrows():
+        # Column names and attribute types only need to be worked out once
+        records = normalise(records)
+        attributes = project(records, self.attributes)  # the whole record is yielded
+        schema = Schema(attributes, self.attributes)
+        tests = indexed(self.ruleset.specialise(schema), self.matchers, schema)
+
+        # The rules test the column values, a row Series of numeric columns would upcast integers to floats
+        values = cache_keys(attributes, self.attributes) if self.cache.maxsize else repeat(None, len(records))
+        for values, view, (idx, record) in zip(values, rows(attributes), records.iterrows()):
             result, steps = None, None
-            try:
-                result, steps = self.classify(record, id_field)
-            except (ClassificationError, MultipleMatchesError):
-                pass
+            status, path, matches = self._classify_cached(values, view, tests)
+            if status == CLASSIFIED:
+                result, steps = _output([self.graph.couplets[node] for node in path], record, id_field)
 
             yield result, steps, record
 
+    def classify_records(self, records, columns=None):
+        """
+        Classify records that aren't in a DataFrame, e.g. dicts from a message queue or the
+        namedtuples from :code:`DataFrame.itertuples()`, without converting each one to a Series.
+
+        How attribute values are read is chosen once, from the first record, see victa.records.accessor
+
+        Args:
+            records (iterable): mappings, namedtuples or sequences of values, all of the same kind
+            columns (sequence or mapping, optional): column names of sequence records, see victa.records.accessor
+
+        Yields:
+            tuple(victa.Couplet, tuple, object): the output class, the IDs of the couplets that were traversed
+                and the input record
+        Notes:
+            Will yield tuple(None, tuple, object) on ClassificationError, MultipleMatchesError
+        """
+        graph, tests, attributes = self.graph, self.tests, self.attributes
+        cached = bool(self.cache.maxsize)
+        view = None
+        for record in records:
+            if view is None:
+                view = accessor(record, columns)
+            values = view(record)
+            status, path, matches = self._classify_cached(cache_key(values, attributes) if cached else None,
+                                                          values, tests)
+            couplet = graph.couplets[path[-1]] if status == CLASSIFIED else None
+            yield couplet, tuple(graph.ids[node] for node in path), record
+
+    def classify_table(self, records, id_field=None, paths=None):
+        """
+        Classify a DataFrame of records and collect the results in a columnar ResultTable
+
+        Args:
+            records (pandas.DataFrame): records to be classified
+                records need to contain all columns (DataFrame axis labels) referred to in the :code:`Rule`s
+                see victa.key.build_rules
+            id_field (str): column name to use as unique ID field
+            paths (victa.results.ResultTable, optional): share the decision paths of another table,
+                so path IDs are the same in both tables
+
+        Returns:
+            victa.results.ResultTable: results, including records that couldn't be classified
+
+        Raises:
+            MissingAttributeError: When records don't have all the attributes referred to by the rules
+        """
+        if id_field:
+            id_field = id_field.upper()
+
+        records = project(records, self.attributes, id_field)
+        schema = Schema(records, self.attributes)
+        tests = indexed(self.ruleset.specialise(schema), self.matchers, schema)
+
+        graph = self.graph
+        table = ResultTable(len(records), dict(zip(graph.ids, graph.couplets)), id_field, records.index, paths)
+        record_ids = records[id_field].tolist() if id_field else repeat(None)
+        values = cache_keys(records, self.attributes) if self.cache.maxsize else repeat(None, len(records))
+        for position, (values, record, record_id) in enumerate(zip(values, rows(records), record_ids)):
+            status, path, matches = self._classify_cached(values, record, tests)
+            table.add(position, tuple(graph.ids[node] for node in path), status, record_id,
+                      tuple(graph.rulesets[edge] for edge in matches) if matches else None)
+
+        return table
+
+    def classify_stream(self, chunks, id_field=None):
+        """
+        Classify an iterator of DataFrames one chunk at a time, e.g. from
+        :code:`pandas.read_csv(..., chunksize=N)` or :code:`pandas.read_sql(..., chunksize=N)`
+
+        Only one chunk of records is held in memory at a time. Decision paths are shared between the
+        result tables so path IDs are consistent for the whole stream and the path table of the last
+        result table covers every chunk.
+
+        Args:
+            chunks (iterable): pandas.DataFrame chunks of records to be classified
+            id_field (str): column name to use as unique ID field
+
+        Yields:
+            victa.results.ResultTable: results for each chunk
+        """
+        table = None
+        for records in chunks:
+            table = self.classify_table(records, id_field, table)
+            yield table
+
+    def diff(self, previous):
+        """
+        Compare this key to a previous version of it
+
+        Args:
+            previous (victa.Key): previous version of the key, e.g. loaded with victa.Key.load
+
+        Returns:
+            victa.diff.KeyDiff: the changed rules, edges and couplets
+        """
+        return diff(previous, self)
+
+    def reclassify(self, records, previous, changes, id_field=None):
+        """
+        Update the results of an earlier run after the key or rules were edited
+
+        Only the records whose decision path touched a changed couplet are classified again,
+        the results of the rest are carried over.
+
+        Args:
+            records (pandas.DataFrame): the same records, in the same order, that :code:`previous` was classified from
+            previous (victa.results.ResultTable): results from the previous version of the key,
+                result tables can be pickled to keep them between runs
+            changes (victa.diff.KeyDiff): changes since the previous version, see victa.Key.diff
+            id_field (str): column name to use as unique ID field
+
+        Returns:
+            victa.results.ResultTable: results for all the records
+
+        Raises:
+            ValueError: When the number of records doesn't match the previous results
+            MissingAttributeError: When records don't have all the attributes referred to by the rules
+        """
+        if len(records) != len(previous):
+            raise ValueError('There are {} records but {} previous results'.format(len(records), len(previous)))
+        if id_field:
+            id_field = id_field.upper()
+
+        affected = changes.affected(previous)
+        graph = self.graph
+        table = ResultTable(len(records), dict(zip(graph.ids, graph.couplets)), id_field, records.index)
+
+        carried = np.flatnonzero(~affected)
+        table.update(carried, previous, carried)
+
+        positions = np.flatnonzero(affected)
+        if len(positions):
+            table.update(positions, self.classify_table(records.iloc[positions], id_field, table))
+        return table
+
+    def classify_frame(self, records, id_field=None, errors='raise'):
+        """
+        Classify all records in a DataFrame at once.
+
+        Rules are evaluated as boolean masks over whole columns and the records are pushed
+        through the key one level at a time, only the records still at a couplet are tested against
+        that couplet's rulesets.
+
+        Args:
+            records (pandas.DataFrame): records to be classified
+                records need to contain all columns (DataFrame axis labels) referred to in the :code:`Rule`s
+                see victa.key.build_rules
+            id_field (str): column name to use as unique ID field
+            errors (str): :code:`'raise'` to raise a ClassificationError or MultipleMatchesError for the first
+                record that can't be classified or :code:`'ignore'` to leave it out of the output
+
+        Returns:
+            tuple(pandas.DataFrame, pandas.Dataframe): the output classes (indexed by the records index)
+                and the couplets that were traversed
+
+        Raises:
+            ClassificationError: When unable to classify a record
+            MultipleMatchesError: When a record matches multiple rulesets
+            MissingAttributeError: When records don't have all the attributes referred to by the rules
+        """
+        if errors not in ('raise', 'ignore'):
+            raise ValueError('errors must be one of "raise" or "ignore"')
+
+        if id_field:
+            id_field = id_field.upper()
+        records = project(records, self.attributes, id_field)
+
+        graph = self.graph
+        couplets = graph.couplets
+        stats = self.instrumentation
+        masks = RuleMasks(self.ruleset, records, Schema(records, self.attributes), self.matchers)
+
+        # Position of each record in the key, record status and the position at each step
+        current = np.full(len(records), graph.root)
+        status = np.full(len(records), _ACTIVE)
+        history = [current.copy()]
+
+        for i in range(len(couplets)*2):
+            active = np.flatnonzero(status == _ACTIVE)
+            if not active.size:
+                break
+
+            step = np.full(len(records), -1)
+
+            # Group the active records by the couplet they're at
+            order = np.argsort(current[active], kind='stable')
+            groups, starts = np.unique(current[active][order], return_index=True)
+            for node, rows in zip(groups, np.split(active[order], starts[1:])):
+                matches = np.zeros(len(rows), dtype=int)
+                for edge in graph.edges(node):
+                    mask = self.ruleset.mask(graph.rulesets[edge], records, masks, rows)
+                    matches += mask
+                    step[rows[mask]] = graph.targets[edge]
+                    if stats is not None:
+                        stats.hits[edge] += int(mask.sum())
+
+                if stats is not None:
+                    stats.visits[node] += len(rows)
+
+                status[rows[matches == 0]] = UNCLASSIFIED
+                status[rows[matches > 1]] = MULTIPLE_MATCHES
+
+                rows = rows[matches == 1]
+                current[rows] = step[rows]
+                classes = np.fromiter((couplets[c].type == 'class' for c in step[rows]), dtype=bool, count=len(rows))
+                status[rows[classes]] = CLASSIFIED
+
+            step[status > CLASSIFIED] = -1
+            history.append(step)
+        status[status == _ACTIVE] = UNCLASSIFIED
+
+        if errors == 'raise' and (status != CLASSIFIED).any():
+            i = np.argmax(status != CLASSIFIED)
+            record = records.iloc[i]
+            path = [c for c in (h[i] for h in history) if c >= 0]
+            matches = [edge for edge in graph.edges(path[-1]) if self.ruleset.test(graph.compiled[edge], record)]
+            raise self._error(status[i], path, matches, record, id_field)
+
+        # Build the outputs
+        classified = np.flatnonzero(status == CLASSIFIED)
+        fields = list(Couplet._fields)
+        table = pd.DataFrame.from_records([c or (None,) * len(fields) for c in couplets], columns=fields)
+
+        result = table.iloc[current[classified]]
+        result.index = records.index[classified]
+
+        history = np.vstack(history).T[classified]
+        position, step = np.nonzero(history >= 0)
+        steps = table.iloc[history[position, step]].reset_index(drop=True)
+        steps = steps.assign(step=step)
+
+        if id_field:
+            result = result.assign(**{id_field: records[id_field].values[classified]})
+            steps = steps.assign(**{id_field: records[id_field].values[classified][position]})
+
+        return result, steps
+
 
 #     def draw_key(self, root=0):
 #         """ Generate a plot of the Key """
@@ -154,6 +767,33 @@ class Key(object):
 #         plt.show()
 
 
+def _output(visited, record, id_field=None):
+    """
+    Build the output of a successful classification
+
+    Args:
+        visited (list): couplets that were traversed, the last is the output class
+        record (pandas.Series): record that was classified
+        id_field (str): column name to use as unique ID field
+
+    Returns:
+        tuple(pandas.Series, pandas.Dataframe): the output class and a the couplets that were traversed
+    """
+    # TODO decide return data model:
+    # tuple(pandas.Series, pandas.Dataframe), tuple(Couplet, list), etc...?
+
+    # return couplet, visited
+    result = visited[-1].to_series()  # Series
+    steps = pd.DataFrame(visited)  # Dataframe
+    steps = steps.assign(step=steps.index)
+
+    if id_field:
+        result.loc[id_field] = record[id_field]
+        steps = steps.assign(**{id_field: record[id_field]})
+
+    return result, steps
+
+
 def build_key(key_df, key_desc):
     """
 
@@ -194,43 +834,224 @@ def build_key(key_df, key_desc):
 
     Returns:
         key: nx.DiGraph
+
+    Raises:
+        RuleSyntaxError: if a RULES expression is not valid python syntax
+        ManadatoryFieldError: if any mandatory fields are empty, along with any other problems
+        ValidationError: for all the rows with duplicate edges or an OUTPUT_COUPLET that has no edges out of it
     """
-    key = nx.DiGraph()
-    key.root = Couplet(0, 'root', key_desc)  # Root couplet ID must always be 0
-    key.add_node(key.root.id, couplet=key.root)
-
-    for idx, row in key_df.iterrows():
-        if pd.isnull(row['INPUT_COUPLET']):
-            raise ManadatoryFieldError('"INPUT_COUPLET" must contain a value')
-        if pd.isnull(row['RULES']):
-            raise ManadatoryFieldError('"RULES" must contain a value')
-        if pd.isnull(row['OUTPUT_CLASS']) and pd.isnull(row['OUTPUT_COUPLET']):
-            raise ManadatoryFieldError('Either "OUTPUT_COUPLET" or "OUTPUT_CLASS" must contain a value')
-        if pd.isnull(row['OUTPUT_NAME']):
-            raise ManadatoryFieldError('"OUTPUT_NAME" must contain a value')
-
-        if pd.isnull(row['COMMENTS']):
-            row['COMMENTS'] = ''
+    return _build_graph(key_df, key_desc).to_networkx()
 
-        try:
-            in_couplet = int(row['INPUT_COUPLET'])
-        except ValueError:
-            in_couplet = row['INPUT_COUPLET']
 
-        if pd.isnull(row['OUTPUT_COUPLET']):  # leaf node
-            out_couplet = 'OUTPUT_CLASS'
-            out_type = 'class'
+def _build_graph(key_df, key_desc):
+    """
+    Build a compact KeyGraph containing couplets joined by rules
+
+    Args:
+        key_df (pandas.DataFrame): see victa.key.build_key
+        key_desc (str): see victa.key.build_key
+
+    Returns:
+        victa.key.KeyGraph:
+
+    Raises:
+        RuleSyntaxError: if a RULES expression is not valid python syntax
+        ManadatoryFieldError: if any mandatory fields are empty, along with any other problems
+        ValidationError: for all the rows with duplicate edges or an OUTPUT_COUPLET that has no edges out of it
+    """
+    mandatory = ['INPUT_COUPLET', 'RULES', 'OUTPUT_COUPLET', 'OUTPUT_CLASS', 'OUTPUT_NAME']
+    missing = [column for column in mandatory if column not in key_df]
+    if missing:
+        raise ManadatoryFieldError('Missing columns {}'.format(', '.join('"{}"'.format(m) for m in missing)))
+
+    # Ensure mandatory fields are not empty, checking every row at once
+    nulls = key_df[mandatory].isnull()
+    checks = [(nulls['INPUT_COUPLET'], '"INPUT_COUPLET" must contain a value'),
+              (nulls['RULES'], '"RULES" must contain a value'),
+              (nulls['OUTPUT_CLASS'] & nulls['OUTPUT_COUPLET'],
+               'Either "OUTPUT_COUPLET" or "OUTPUT_CLASS" must contain a value'),
+              (nulls['OUTPUT_NAME'], '"OUTPUT_NAME" must contain a value')]
+    # Sorted by row position, labels may not be unique (e.g. frames concatenated without ignore_index)
+    labels = key_df.index.tolist()
+    problems = [(labels[position], msg) for position, msg in sorted(
+        (position, msg) for invalid, msg in checks for position in np.flatnonzero(invalid.to_numpy()))]
+    error = ManadatoryFieldError if problems else ValidationError
+
+    valid = ~np.logical_or.reduce([invalid.to_numpy() for invalid, msg in checks])
+    key_df = key_df[valid]
+
+    leaf = key_df['OUTPUT_COUPLET'].isnull().to_numpy()
+    in_ids = [_couplet_id(c) for c in key_df['INPUT_COUPLET'].tolist()]
+    out_ids = [_couplet_id(c) for c in np.where(leaf, key_df['OUTPUT_CLASS'].to_numpy(dtype=object),
+                                                key_df['OUTPUT_COUPLET'].to_numpy(dtype=object)).tolist()]
+    rules = [str(r).strip() for r in key_df['RULES'].tolist()]
+    names = key_df['OUTPUT_NAME'].tolist()
+    comments = key_df['COMMENTS'].fillna('').tolist() if 'COMMENTS' in key_df else [''] * len(key_df)
+
+    root = Couplet(0, 'root', key_desc)  # Root couplet ID must always be 0
+    couplets, index, edges = [root], {root.id: KeyGraph.root}, [OrderedDict()]
+
+    def add_node(couplet_id):
+        if couplet_id not in index:
+            index[couplet_id] = len(couplets)
+            couplets.append(None)
+            edges.append(OrderedDict())
+        return index[couplet_id]
+
+    edge_rows, couplet_rows = {}, {}  # first row of each edge and output couplet
+    for label, in_id, out_id, is_leaf, expr, name, comment in zip(
+            key_df.index, in_ids, out_ids, leaf, rules, names, comments):
+        if (in_id, out_id) in edge_rows:
+            problems.append((label, 'Duplicate edge from couplet "{}" to "{}" (also row {})'.format(
+                in_id, out_id, edge_rows[in_id, out_id])))
+            continue
+        edge_rows[in_id, out_id] = label
+        couplet_rows.setdefault(out_id, label)
+
+        out_couplet = add_node(out_id)
+        couplets[out_couplet] = Couplet(out_id, 'class' if is_leaf else 'couplet', name, comment)
+        edges[add_node(in_id)][out_couplet] = expr
+
+    # Couplets that can't be left
+    for node, couplet in enumerate(couplets):
+        if couplet is not None and couplet.type == 'couplet' and not edges[node]:
+            problems.append((couplet_rows[couplet.id], '"OUTPUT_COUPLET" {} is not an "INPUT_COUPLET"'.format(couplet.id)))
+
+    if problems:
+        raise error(problems)
+
+    return KeyGraph(couplets, index, edges)
+
+
+def _couplet_id(couplet_id):
+    """Integer couplet IDs where possible"""
+    try:
+        return int(couplet_id)
+    except (TypeError, ValueError):
+        return couplet_id
+
+
+def _check_rules(graph, ruleset):
+    """
+    Check every rule referred to by the key is in the ruleset
+
+    Raises:
+        ValidationError: for all the rulesets that refer to unknown rules
+    """
+    problems = []
+    for node in range(len(graph)):
+        for edge in graph.edges(node):
+            unknown = rule_ids(graph.rulesets[edge]) - set(ruleset)
+            if unknown:
+                problems.append((None, 'RULES "{}" from couplet "{}" to "{}" refer to unknown rules {}'.format(
+                    graph.rulesets[edge], graph.ids[node], graph.ids[graph.targets[edge]],
+                    ', '.join(str(r) for r in sorted(unknown, key=str)))))
+    if problems:
+        raise ValidationError(problems)
+
+
+class KeyGraph(object):
+    """
+    Compact, read-only representation of a classification Key used when classifying records
+
+    Couplets are identified by an integer index, the root couplet is always index 0.
+    The edges out of the couplet at index :code:`i` are :code:`offsets[i]` to :code:`offsets[i + 1]`
+    in the parallel :code:`targets`, :code:`rulesets` and :code:`compiled` edge arrays.
+
+    Args:
+        couplets (list): Couplet at each index, None if the couplet is only ever an INPUT_COUPLET
+        index (dict): couplet ID to index mapping
+        edges (list): mapping of output couplet index to RULES expression for each couplet index
+
+    Attributes:
+        couplets (tuple): Couplet at each index
+        ids (tuple): couplet ID at each index
+        index (dict): couplet ID to index mapping
+        offsets (tuple): start of the edges out of each couplet, with a final end offset
+        targets (tuple): output couplet index for each edge
+        rulesets (tuple): RULES expression for each edge
+        compiled (tuple): compiled RULES expression for each edge, see victa.rules.parse
+        exclusive (tuple): True for each couplet index if its rulesets are proven to be mutually exclusive,
+            see victa.analysis.exclusive_couplets. None until it's worked out, see victa.Key.exclusive
+    """
+    __slots__ = ('couplets', 'ids', 'index', 'offsets', 'targets', 'rulesets', 'compiled', 'exclusive')
+
+    root = 0
+
+    def __init__(self, couplets, index, edges):
+        self.couplets = tuple(couplets)
+        self.index = dict(index)
+        self.ids = tuple(sorted(self.index, key=self.index.get))
+        self.offsets = tuple(np.cumsum([0] + [len(e) for e in edges]).tolist())
+        self.targets = tuple(t for e in edges for t in e)
+        self.rulesets = tuple(r for e in edges for r in e.values())
+        self.compiled = tuple(parse(r) for r in self.rulesets)
+        self.exclusive = None
+
+    def __len__(self):
+        return len(self.couplets)
+
+    def __getstate__(self):
+        # Compiled expressions can't be pickled, but their code can be marshalled
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        state['compiled'] = (sys.version_info[:2], [marshal.dumps(func.__code__) for func in self.compiled])
+        return state
+
+    def __setstate__(self, state):
+        version, code = state.pop('compiled')
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+        # Marshalled code is specific to a python version, recompile if it was saved by a different version
+        if tuple(version) == sys.version_info[:2]:
+            self.compiled = tuple(FunctionType(marshal.loads(c), {}) for c in code)
         else:
-            out_couplet = 'OUTPUT_COUPLET'
-            out_type = 'couplet'
+            self.compiled = tuple(parse(r) for r in self.rulesets)
 
-        try:
-            couplet = Couplet(int(row[out_couplet]), out_type, row['OUTPUT_NAME'], row['COMMENTS'])
-        except ValueError:
-            couplet = Couplet(row[out_couplet], out_type, row['OUTPUT_NAME'], row['COMMENTS'])
+    def reorder(self, order):
+        """
+        Change the order edges are tested in
+
+        Args:
+            order (list): all edge indices in the new order, the edges out of each couplet must stay
+                within the couplet's offsets
+        """
+        self.targets = tuple(self.targets[e] for e in order)
+        self.rulesets = tuple(self.rulesets[e] for e in order)
+        self.compiled = tuple(self.compiled[e] for e in order)
+
+    def edges(self, node):
+        """
+        Edges out of a couplet
+
+        Args:
+            node (int): couplet index
 
-        key.add_node(couplet.id, couplet=couplet)
-        key.add_edge(in_couplet, couplet.id, ruleset=str(row['RULES']).strip())
+        Returns:
+            range: edge indices
+        """
+        return range(self.offsets[node], self.offsets[node + 1])
+
+    def to_networkx(self):
+        """
+        Build a NetworkX DiGraph containing couplets (nodes) joined by rules (edges)
+
+        Returns:
+            key: nx.DiGraph
+        """
+        import networkx as nx  # Only needed for graph features, it's slow to import
+
+        key = nx.DiGraph()
+        key.root = self.couplets[self.root]
+        for couplet_id, couplet in zip(self.ids, self.couplets):
+            if couplet is None:
+                key.add_node(couplet_id)
+            else:
+                key.add_node(couplet_id, couplet=couplet)
 
-    return key
+        for node, couplet_id in enumerate(self.ids):
+            for edge in self.edges(node):
+                key.add_edge(couplet_id, self.ids[self.targets[edge]],
+                             ruleset=self.rulesets[edge], compiled=self.compiled[edge])
 
+        return key
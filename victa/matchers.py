@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+
+Shared matchers for rules that test the same attribute
+
+Keys often have many :code:`regex`, :code:`in` and :code:`=` rules on one text attribute
+(e.g. a structural/floristic description) and many :code:`>=`, :code:`<` etc... rules with different
+thresholds on one numeric attribute (e.g. height or cover). Instead of each rule converting and
+testing the value on its own, the rules are grouped by attribute and tested together.
+
+Text rules (victa.matchers.TextMatcher):
+
+ - the values are converted to upper case text once
+ - all the :code:`=` rules are tested with a single dict lookup per value
+ - each :code:`in` and :code:`regex` rule is tested against all the converted values at once
+
+Text matchers are used when rules are tested against the distinct values of a whole column, see
+victa.rules.RuleMasks, where every rule in a group is tested against every value. Single records
+(victa.Key.classify etc...) still test text rules one at a time, as only the few rules on the path
+through the key are tested.
+
+Numeric rules (victa.matchers.ThresholdIndex):
+
+ - the value is converted to a number once
+ - one bisect of the sorted thresholds gives the result of every range rule, :code:`=` rules
+   are still compared with :code:`isclose`
+
+Threshold indexes are used for single records and for columns that aren't entirely numeric,
+numeric columns are compared to each threshold with numpy.
+
+"""
+
+__all__ = ['TextMatcher', 'ThresholdIndex', 'group_rules', 'indexed']
+
+import re
+from bisect import bisect_left, bisect_right
+from functools import partial
+
+import numpy as np
+
+from .rules import _to_number
+from .utils import isclose
+
+# Operators that can be grouped, text '=' only when the rule value isn't a number
+OPERATORS = ('=', 'in', 'regex')
+NUMERIC_OPERATORS = ('=', '>=', '>', '<=', '<')
+
+
+class TextMatcher(object):
+    """
+    Test the text rules on one attribute together
+
+    Each value is converted to text once, then every rule in the group is tested against the converted text.
+
+    Args:
+        rules (dict): victa.Rule objects by rule ID, all on the same attribute with an operator in
+            victa.matchers.OPERATORS and a value that isn't a number
+
+    Attributes:
+        attribute (str): attribute the rules test
+        rule_ids (tuple): IDs of the rules in the group
+    """
+    def __init__(self, rules):
+        self.rule_ids = tuple(rules)
+        self.attribute = None
+        self.equal = {}  # rule value: IDs of the rules with that value
+        self.rules = {}  # rule ID: test(text), for the in and regex rules
+
+        for rule_id, rule in rules.items():
+            self.attribute = rule.attribute
+            if rule.operator == 'in':
+                self.rules[rule_id] = partial(_contains, rule.value)
+            elif rule.operator == 'regex':
+                # Regexes of unpickled rules may not be compiled yet, see victa.rules.Rule.__reduce__
+                pattern = re.compile(getattr(rule.value, 'pattern', rule.value), re.IGNORECASE)
+                self.rules[rule_id] = partial(_search, pattern.search)
+            else:
+                self.equal.setdefault(rule.value, set()).add(rule_id)
+
+    def test_uniques(self, uniques):
+        """
+        Test every rule in the group against a sequence of (distinct) attribute values
+
+        Args:
+            uniques (sequence): attribute values
+
+        Returns:
+            dict: boolean array for each rule by rule ID
+        """
+        texts = [str(value).strip().upper() for value in uniques]
+        results = {}
+        for rule_id in self.rule_ids:
+            test = self.rules.get(rule_id)
+            if test is None:  # = rule
+                results[rule_id] = np.zeros(len(texts), dtype=bool)
+            else:
+                results[rule_id] = np.fromiter(map(test, texts), dtype=bool, count=len(texts))
+
+        for i, text in enumerate(texts):
+            for rule_id in self.equal.get(text, ()):
+                results[rule_id][i] = True
+        return results
+
+
+def _contains(substring, text):
+    return substring in text
+
+
+def _search(search, text):
+    return search(text) is not None
+
+
+class ThresholdIndex(object):
+    """
+    Test the numeric rules on one attribute with a single bisect of their sorted thresholds
+
+    Values that aren't numbers are compared as text by each rule, see victa.Rule
+
+    Args:
+        rules (dict): victa.Rule objects by rule ID, all on the same attribute with an operator in
+            victa.matchers.NUMERIC_OPERATORS and a numeric value that isn't NaN
+
+    Attributes:
+        attribute (str): attribute the rules test
+        rule_ids (tuple): IDs of the rules in the group
+        thresholds (list): distinct rule values, sorted
+    """
+    def __init__(self, rules):
+        self.rule_ids = tuple(rules)
+        self.attribute = None
+        self.thresholds = sorted({rule.number for rule in rules.values()})
+        ranks = {number: rank for rank, number in enumerate(self.thresholds)}
+        self.rules = {}  # rule ID: (operator, rank, rule)
+        for rule_id, rule in rules.items():
+            self.attribute = rule.attribute
+            self.rules[rule_id] = (rule.operator, ranks[rule.number], rule)
+        self._last = (None, None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_last'] = (None, None)
+        return state
+
+    def position(self, value):
+        """
+        Position of a single attribute value in the thresholds
+
+        Args:
+            value: attribute value
+
+        Returns:
+            tuple(float, int, int): the value as a number and the number of thresholds less than and
+                less than or equal to it. Or None if the value isn't a number, or (NaN, None, None) if it's NaN
+        """
+        number = _to_number(value)
+        if number is None:
+            return None
+        if number != number:  # NaN
+            return number, None, None
+        return number, bisect_left(self.thresholds, number), bisect_right(self.thresholds, number)
+
+    def test(self, value, rule_id):
+        """
+        Test a rule in the index against a single attribute value, the value is only converted and bisected
+        once for consecutive tests against the same value
+
+        Args:
+            value: attribute value
+            rule_id (int): rule ID
+
+        Returns:
+            Bool:
+        """
+        last, position = self._last
+        if not (value is last or (value.__class__ is last.__class__ and value.__class__ is not str
+                                  and value == last)):
+            position = self.position(value)
+            self._last = (value, position)
+
+        operator, rank, rule = self.rules[rule_id]
+        if position is None:
+            return rule.test(value)
+
+        number, less, less_equal = position
+        if less is None:
+            return False
+        elif operator == '>=':
+            return less_equal > rank
+        elif operator == '>':
+            return less > rank
+        elif operator == '<':
+            return less_equal <= rank
+        elif operator == '<=':
+            return less <= rank
+        return isclose(number, self.thresholds[rank])
+
+    def test_numbers(self, numbers):
+        """
+        Test every rule in the index against an array of numbers
+
+        Args:
+            numbers (numpy.ndarray): float attribute values
+
+        Returns:
+            dict: boolean array for each rule by rule ID
+        """
+        thresholds = np.array(self.thresholds, dtype=float)
+        valid = ~np.isnan(numbers)
+        less = np.searchsorted(thresholds, numbers, 'left')
+        less_equal = np.searchsorted(thresholds, numbers, 'right')
+
+        results = {}
+        for rule_id, (operator, rank, rule) in self.rules.items():
+            if operator == '>=':
+                results[rule_id] = valid & (less_equal > rank)
+            elif operator == '>':
+                results[rule_id] = valid & (less > rank)
+            elif operator == '<':
+                results[rule_id] = valid & (less_equal <= rank)
+            elif operator == '<=':
+                results[rule_id] = valid & (less <= rank)
+            else:
+                results[rule_id] = rule.test_numbers(numbers)
+        return results
+
+    def test_uniques(self, uniques):
+        """
+        Test every rule in the index against a sequence of (distinct) attribute values
+
+        Args:
+            uniques (sequence): attribute values
+
+        Returns:
+            dict: boolean array for each rule by rule ID
+        """
+        numbers = [_to_number(value) for value in uniques]
+        numeric = np.array([number is not None for number in numbers], dtype=bool)
+        results = self.test_numbers(np.array([np.nan if n is None else n for n in numbers], dtype=float))
+        if not numeric.all():
+            text = [value for value, number in zip(uniques, numbers) if number is None]
+            for rule_id, (operator, rank, rule) in self.rules.items():
+                results[rule_id][~numeric] = [rule.test(value) for value in text]
+        return results
+
+    def tester(self, rule_id):
+        """
+        Get a test for one rule in the index
+
+        Args:
+            rule_id (int): rule ID
+
+        Returns:
+            function: :code:`test(record)`
+        """
+        test = self.test
+        attribute = self.attribute
+
+        def matches(record):
+            return test(getattr(record, attribute), rule_id)
+        return matches
+
+
+def group_rules(ruleset, min_rules=2):
+    """
+    Group the text rules and the numeric rules of a ruleset by attribute
+
+    Args:
+        ruleset (victa.RuleSet): rules
+        min_rules (int): minimum number of rules on an attribute for them to be grouped
+
+    Returns:
+        dict: victa.matchers.TextMatcher or victa.matchers.ThresholdIndex by rule ID, for each rule that was grouped
+    """
+    groups = {}
+    for rule_id, rule in ruleset.items():
+        operator = getattr(rule, 'operator', None)
+        if operator in OPERATORS and rule.number is None:
+            groups.setdefault((TextMatcher, rule.attribute), {})[rule_id] = rule
+        elif operator in NUMERIC_OPERATORS and rule.number is not None and rule.number == rule.number:
+            # NaN thresholds can't be sorted, those rules are tested on their own
+            groups.setdefault((ThresholdIndex, rule.attribute), {})[rule_id] = rule
+
+    matchers = {}
+    for (matcher, attribute), rules in groups.items():
+        if len(rules) >= min_rules:
+            matchers.update(dict.fromkeys(rules, matcher(rules)))
+    return matchers
+
+
+def indexed(tests, matchers, schema=None):
+    """
+    Replace the tests of rules in a victa.matchers.ThresholdIndex with tests that share the index
+
+    Args:
+        tests (victa.RuleSet or dict): rules to test, or specialised tests from victa.RuleSet.specialise
+        matchers (dict): matchers by rule ID, see victa.matchers.group_rules
+        schema (victa.records.Schema, optional): attribute types of a batch of records, the specialised tests
+            of numeric attributes are kept as they don't need to convert the value
+
+    Returns:
+        dict: :code:`test(record)` function for each rule ID, can be passed to victa.rules.RuleResults
+    """
+    tests = dict(tests)
+    for rule_id, matcher in matchers.items():
+        if rule_id in tests and isinstance(matcher, ThresholdIndex):
+            if schema is None or schema[matcher.attribute] != 'numeric':
+                tests[rule_id] = matcher.tester(rule_id)
+    return tests
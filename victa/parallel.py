@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+
+Parallel classification
+
+"""
+
+__all__ = ['classify_parallel']
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from .records import project
+from .results import ResultTable
+
+_key = None  # Key used by each worker process
+
+
+def classify_parallel(key, records, id_field=None, workers=None, chunksize=10000):
+    """
+    Classify a DataFrame of records in parallel, see victa.Key.classify_parallel
+
+    Args:
+        key (victa.Key): key to classify the records with
+        records (pandas.DataFrame): records to be classified
+        id_field (str): column name to use as unique ID field
+        workers (int, optional): number of worker processes, default is the number of CPUs
+        chunksize (int, optional): number of records sent to a worker at a time
+
+    Returns:
+        victa.results.ResultTable:
+    """
+    # Only send the columns the rules need to the workers
+    records = project(records, key.attributes, id_field.upper() if id_field else None)
+
+    if len(records) <= chunksize:
+        return key.classify_table(records, id_field)
+
+    chunks = (records.iloc[i:i + chunksize] for i in range(0, len(records), chunksize))
+    with ProcessPoolExecutor(workers, initializer=_initialise, initargs=(key,)) as executor:
+        tables = executor.map(_classify, chunks, repeat(id_field))
+        return ResultTable.concat(tables, dict(zip(key.graph.ids, key.graph.couplets)))
+
+
+def _initialise(key):
+    global _key
+    _key = key
+
+
+def _classify(records, id_field):
+    return _key.classify_table(records, id_field)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+
+Decision paths
+
+The number of distinct paths through a key is small compared to the number of records, so each distinct
+path (sequence of couplet IDs) is stored once and records only refer to it by an integer path ID.
+The couplets in each path are only joined to the records when requested.
+
+"""
+
+__all__ = ['PathStore']
+
+import pandas as pd
+
+from .couplets import Couplet
+
+
+class PathStore(object):
+    """
+    Interned decision paths, each distinct path is stored once under an integer path ID
+
+    Path IDs are assigned in the order paths are first added, starting at 0. A store can be shared by several
+    victa.results.ResultTable objects so their path IDs are the same.
+
+    Args:
+        paths (iterable, optional): paths to add
+    """
+    def __init__(self, paths=()):
+        self.paths = []
+        self._ids = {}
+        for path in paths:
+            self.add(path)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __getitem__(self, path_id):
+        return self.paths[path_id]
+
+    def __contains__(self, path):
+        return path in self._ids
+
+    def __repr__(self):
+        return '{}({} paths)'.format(type(self).__name__, len(self))
+
+    def add(self, path):
+        """
+        Add a path if it isn't already stored
+
+        Args:
+            path (tuple): IDs of the couplets that were traversed
+
+        Returns:
+            int: path ID
+        """
+        try:
+            return self._ids[path]
+        except KeyError:
+            path_id = self._ids[path] = len(self.paths)
+            self.paths.append(path)
+            return path_id
+
+    def to_frame(self, couplets=None, categorical=True):
+        """
+        The couplets in each path, one row per step
+
+        Args:
+            couplets (dict, optional): Couplet for each couplet ID, to include the couplet type, name and comments
+            categorical (bool): store the couplet type, name and comments as categories,
+                each distinct value is stored once
+
+        Returns:
+            pandas.DataFrame: path_id, step and couplet ID (and type, name and comments) of each step in each path
+        """
+        rows = [(path_id, step, c) for path_id, path in enumerate(self.paths) for step, c in enumerate(path)]
+        frame = pd.DataFrame.from_records(rows, columns=['path_id', 'step', 'id'])
+        if couplets is None:
+            return frame
+
+        for field in Couplet._fields[1:]:
+            values = [getattr(couplets[c], field) for c in frame['id']]
+            frame[field] = pd.Categorical(values) if categorical else values
+        return frame[['path_id', 'step'] + list(Couplet._fields)]
+
+    def join(self, path_ids, couplets, categorical=True):
+        """
+        The couplets traversed by each record
+
+        Args:
+            path_ids (sequence): path ID of each record
+            couplets (dict): Couplet for each couplet ID
+            categorical (bool): see victa.paths.PathStore.to_frame
+
+        Returns:
+            pandas.DataFrame: the path table rows for each record, with a :code:`position` column
+                that is the position of the record in :code:`path_ids`
+        """
+        records = pd.DataFrame({'position': range(len(path_ids)), 'path_id': path_ids})
+        return records.merge(self.to_frame(couplets, categorical), on='path_id', how='inner', sort=False)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+
+Records to be classified
+
+Column names are normalised and attribute types are inferred once for a batch of records,
+instead of for every record.
+
+Records can be pandas Series, mappings (e.g. dicts), namedtuples (e.g. from :code:`DataFrame.itertuples()`)
+or plain sequences of values with their column names. How attribute values are read is chosen once
+for a batch of records, see victa.records.accessor.
+"""
+
+__all__ = ['accessor', 'normalise', 'project', 'rows', 'MappingRecord', 'SequenceRecord', 'Schema']
+
+from collections.abc import Mapping
+from functools import lru_cache
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from .errors import MissingAttributeError
+from .rules import _NUMBER
+
+NUMERIC, STRING, MIXED = 'numeric', 'string', 'mixed'
+
+
+def normalise(records):
+    """
+    Upper case the column names (DataFrame) or axis labels (Series) of records.
+
+    Make all column headers upper case, as sqlalchemy columns are returned lower,
+    cx_oracle are upper and csv/excel could be any case.
+    The records are not modified.
+
+    Args:
+        records (pandas.DataFrame or pandas.Series): records
+
+    Returns:
+        pandas.DataFrame or pandas.Series: records with upper case column names
+    """
+    if isinstance(records, pd.DataFrame):
+        return records.rename(columns=lambda i: i.upper())
+    return records.rename(lambda i: i.upper())
+
+
+def accessor(record, columns=None):
+    """
+    Choose how to read attribute values from records of the same kind as :code:`record`.
+
+    The returned function wraps a record so that attribute values can be read by upper case name,
+    as an attribute (:code:`record.HEIGHT`) or an item (:code:`record['HEIGHT']`), which is what
+    the rules and keys expect. Series and mappings are copied with upper case names,
+    sequences are wrapped without copying the values.
+
+    Args:
+        record (pandas.Series, mapping, namedtuple or sequence): a record, e.g. the first of a batch
+        columns (sequence or mapping, optional): column names of sequence records, in order,
+            or a mapping of column name to position. Defaults to the fields of a namedtuple
+
+    Returns:
+        function: :code:`view(record)`
+
+    Raises:
+        TypeError: When the records are sequences without column names
+    """
+    if isinstance(record, pd.Series):
+        return normalise
+    if isinstance(record, Mapping):
+        return MappingRecord
+    if columns is None:
+        columns = getattr(record, '_fields', None)
+        if columns is None:
+            raise TypeError('Column names are needed to read "{}" records'.format(type(record).__name__))
+    if isinstance(columns, Mapping):
+        columns = tuple(columns.items())
+    else:
+        columns = tuple((column, position) for position, column in enumerate(columns))
+
+    index = _index(columns)
+    name = dict(columns).get('Index')  # The DataFrame index of DataFrame.itertuples()
+
+    def view(values):
+        return SequenceRecord(values, index, name)
+    return view
+
+
+@lru_cache(maxsize=64)
+def _index(columns):
+    return {str(column).upper(): position for column, position in columns}
+
+
+class MappingRecord(dict):
+    """
+    A mapping record with upper case keys, values can also be read as attributes
+
+    Args:
+        record (mapping): record, e.g. a dict
+    """
+    name = None
+
+    def __init__(self, record):
+        super(MappingRecord, self).__init__((str(k).upper(), v) for k, v in record.items())
+
+    def __getattr__(self, attribute):
+        try:
+            return self[attribute]
+        except KeyError:
+            raise AttributeError(attribute)
+
+
+class SequenceRecord(object):
+    """
+    A read only view of a sequence of values by upper case column name
+
+    Args:
+        values (sequence): record values, e.g. a tuple
+        index (dict): position of each value, by upper case column name
+        name (int, optional): position of the record name (e.g. the DataFrame index), used in error messages
+    """
+    __slots__ = ('values', 'index', '_name')
+
+    def __init__(self, values, index, name=None):
+        self.values = values
+        self.index = index
+        self._name = name
+
+    @property
+    def name(self):
+        return None if self._name is None else self.values[self._name]
+
+    def __getitem__(self, attribute):
+        return self.values[self.index[attribute]]
+
+    def __getattr__(self, attribute):
+        try:
+            return self.values[self.index[attribute]]
+        except KeyError:
+            raise AttributeError(attribute)
+
+    def __contains__(self, attribute):
+        return attribute in self.index
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, dict((k, self[k]) for k in self.index))
+
+
+def project(records, attributes, id_field=None):
+    """
+    Select only the attributes (columns) referred to by the rules, and the id_field, from a DataFrame of records.
+
+    The schema is checked once for the whole DataFrame instead of failing partway through classification.
+    The records are not modified.
+
+    Args:
+        records (pandas.DataFrame): records
+        attributes (iterable): upper case attributes (columns) referred to by the rules
+        id_field (str, optional): upper case column name to use as unique ID field
+
+    Returns:
+        pandas.DataFrame: records with only the required columns, with upper case column names
+
+    Raises:
+        MissingAttributeError: When records don't have all the attributes or the id_field
+    """
+    required = list(attributes)
+    if id_field and id_field not in required:
+        required.append(id_field)
+
+    columns = {str(column).upper(): column for column in records.columns}
+    missing = [attribute for attribute in required if attribute not in columns]
+    if missing:
+        raise MissingAttributeError(missing)
+
+    records = records[[columns[attribute] for attribute in required]]
+    records.columns = required
+    return records
+
+
+def rows(records):
+    """
+    Read each record of a DataFrame from its columns, instead of selecting a row Series.
+
+    Each value keeps the type of its column, whereas the row of a DataFrame whose columns are all numbers
+    is a single float Series, so integers would be tested by the rules as floats (e.g. 5.0 instead of 5).
+
+    Args:
+        records (pandas.DataFrame): records, with normalised column names
+
+    Returns:
+        iterator: a victa.records.SequenceRecord for each record
+    """
+    index = _index(tuple((column, position) for position, column in enumerate(records.columns)))
+    columns = [records.iloc[:, position].to_numpy(dtype=object) for position in range(records.shape[1])]
+    values = zip(*columns) if columns else repeat((), len(records))
+    return (SequenceRecord(v, index) for v in values)
+
+
+class Schema(object):
+    """
+    Inferred types of the attributes (columns) of a batch of records
+
+    Each attribute is one of:
+     - 'numeric': all values are numbers (64 bit floats or integers)
+     - 'string': all values are text and none of them are numbers
+     - 'mixed': anything else
+
+    Args:
+        records (pandas.DataFrame): records, with normalised column names
+        attributes (iterable): attributes (columns) to infer the type of
+
+    Attributes:
+        types (dict): attribute type, by attribute name
+    """
+    def __init__(self, records, attributes):
+        self.types = {attribute: infer_type(records[attribute])
+                      for attribute in set(attributes) if attribute in records}
+
+    def __getitem__(self, attribute):
+        return self.types.get(attribute, MIXED)
+
+
+def infer_type(values):
+    """
+    Infer the type of an array of attribute values
+
+    Args:
+        values (pandas.Series): attribute values
+
+    Returns:
+        str: 'numeric', 'string' or 'mixed'
+    """
+    dtype = values.dtype
+    if isinstance(dtype, np.dtype) and (dtype == np.float64 or dtype.kind in 'iu'):
+        return NUMERIC
+
+    if pd.api.types.infer_dtype(values, skipna=False) == 'string' and not values.isnull().any():
+        if not any(_NUMBER.match(v.strip().upper()) for v in pd.unique(values)):
+            return STRING
+
+    return MIXED
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+
+Classification results
+
+"""
+
+__all__ = ['ResultTable']
+
+import numpy as np
+import pandas as pd
+
+from .couplets import Couplet
+from .errors import ClassificationError, MultipleMatchesError
+from .paths import PathStore
+
+# Record status
+CLASSIFIED, UNCLASSIFIED, MULTIPLE_MATCHES = range(3)
+STATUS = ['classified', 'unclassified', 'multiple matches']
+
+
+class ResultTable(object):
+    """
+    Columnar classification results for a batch of records.
+
+    Results are collected in preallocated arrays, one element per record, and only converted
+    to a DataFrame when requested. Each distinct decision path is stored once and identified by
+    an integer path ID, see victa.paths.PathStore.
+
+    Args:
+        size (int): number of records
+        couplets (dict): Couplet for each couplet ID
+        id_field (str, optional): column name to use as unique ID field
+        index (pandas.Index, optional): index of the records
+        paths (victa.results.ResultTable or victa.paths.PathStore, optional): share the decision paths of another
+            table, so path IDs are the same in both tables
+
+    Attributes:
+        classes (numpy.ndarray): output class ID of each record
+        names (numpy.ndarray): output class name of each record
+        path_ids (numpy.ndarray): decision path ID of each record
+        status (numpy.ndarray): status of each record, one of
+            victa.results.CLASSIFIED, victa.results.UNCLASSIFIED or victa.results.MULTIPLE_MATCHES
+        record_ids (numpy.ndarray): value of the id_field of each record
+        matches (numpy.ndarray): rulesets that matched each record with multiple matches
+        paths (victa.paths.PathStore): decision path (tuple of couplet IDs) for each path ID
+    """
+    def __init__(self, size, couplets, id_field=None, index=None, paths=None):
+        self.couplets = couplets
+        self.id_field = id_field
+        self.index = pd.RangeIndex(size) if index is None else index
+
+        self.classes = np.full(size, None, dtype=object)
+        self.names = np.full(size, None, dtype=object)
+        self.path_ids = np.full(size, -1, dtype=np.int64)
+        self.status = np.full(size, UNCLASSIFIED, dtype=np.int8)
+        self.record_ids = np.full(size, None, dtype=object)
+        self.matches = np.full(size, None, dtype=object)
+
+        if paths is None:
+            self.paths = PathStore()
+        elif isinstance(paths, PathStore):
+            self.paths = paths
+        else:
+            self.paths = paths.paths
+
+    def __len__(self):
+        return len(self.status)
+
+    @classmethod
+    def concat(cls, tables, couplets=None):
+        """
+        Concatenate result tables, in order
+
+        Args:
+            tables (list): victa.results.ResultTable objects
+            couplets (dict, optional): Couplet for each couplet ID, default is the couplets of the first table
+
+        Returns:
+            victa.results.ResultTable:
+        """
+        tables = list(tables)
+        if not tables:
+            return cls(0, couplets)
+
+        index = tables[0].index.append([t.index for t in tables[1:]])
+        table = cls(len(index), couplets or tables[0].couplets, tables[0].id_field, index)
+
+        start = 0
+        for t in tables:
+            end = start + len(t)
+            path_ids = np.array([table.paths.add(path) for path in t.paths] + [-1], dtype=np.int64)
+
+            table.classes[start:end] = t.classes
+            table.names[start:end] = t.names
+            table.path_ids[start:end] = path_ids[t.path_ids]
+            table.status[start:end] = t.status
+            table.record_ids[start:end] = t.record_ids
+            table.matches[start:end] = t.matches
+            start = end
+
+        return table
+
+    def update(self, positions, table, rows=None):
+        """
+        Copy results from another table, e.g. one from an earlier run or one for a subset of the records
+
+        The output class name of classified records is looked up in this table's couplets,
+        so renamed classes are up to date.
+
+        Args:
+            positions (numpy.ndarray): integer positions of the records in this table
+            table (victa.results.ResultTable): table to copy from
+            rows (numpy.ndarray, optional): integer positions of the records in :code:`table`, default is all records
+        """
+        if rows is None:
+            rows = slice(None)
+        path_ids = np.array([self.paths.add(path) for path in table.paths] + [-1], dtype=np.int64)
+        path_ids = path_ids[table.path_ids[rows]]
+        status = table.status[rows]
+
+        # Output class ID and name of each path, for the records that were classified
+        classes = np.array([path[-1] for path in self.paths] + [None], dtype=object)
+        names = np.array([getattr(self.couplets.get(path[-1]), 'name', None) for path in self.paths] + [None],
+                         dtype=object)
+        classified = np.where(status == CLASSIFIED, path_ids, -1)
+
+        self.classes[positions] = classes[classified]
+        self.names[positions] = names[classified]
+        self.path_ids[positions] = path_ids
+        self.status[positions] = status
+        self.record_ids[positions] = table.record_ids[rows]
+        self.matches[positions] = table.matches[rows]
+
+    def add(self, position, path, status=CLASSIFIED, record_id=None, matches=None):
+        """
+        Add the result for a record
+
+        Args:
+            position (int): position of the record
+            path (tuple): IDs of the couplets that were traversed, the last is the output class
+                if the record was classified or the couplet it got stuck at if it wasn't
+            status (int): record status
+            record_id (optional): value of the id_field
+            matches (tuple, optional): rulesets that matched if there were multiple matches
+        """
+        path_id = self.paths.add(path)
+
+        if status == CLASSIFIED:
+            couplet = self.couplets[path[-1]]
+            self.classes[position] = couplet.id
+            self.names[position] = couplet.name
+
+        self.path_ids[position] = path_id
+        self.status[position] = status
+        self.record_ids[position] = record_id
+        if matches:
+            self.matches[position] = matches
+
+    def to_frame(self):
+        """
+        Convert the results to a DataFrame
+
+        Returns:
+            pandas.DataFrame: the output class ID, name, path ID and status of each record
+        """
+        columns = {}
+        if self.id_field:
+            columns[self.id_field] = pd.Series(self.record_ids, index=self.index).infer_objects()
+        columns.update(id=self.classes,
+                       name=self.names,
+                       path_id=self.path_ids,
+                       status=pd.Categorical.from_codes(self.status, STATUS))
+        return pd.DataFrame(columns, index=self.index)
+
+    def errors(self):
+        """
+        The records that couldn't be classified
+
+        Returns:
+            pandas.DataFrame: the status, the couplet each record got stuck at and the rulesets that matched
+                if there were multiple matches, indexed by the records index
+        """
+        failed = np.flatnonzero(self.status != CLASSIFIED)
+
+        columns = {}
+        if self.id_field:
+            columns[self.id_field] = pd.Series(self.record_ids[failed]).infer_objects().values
+        columns.update(status=pd.Categorical.from_codes(self.status[failed], STATUS),
+                       couplet=[self.paths[self.path_ids[i]][-1] for i in failed],
+                       path_id=self.path_ids[failed],
+                       rulesets=self.matches[failed])
+        return pd.DataFrame(columns, index=self.index[failed])
+
+    def error(self, position, record=None):
+        """
+        The exception for a record that couldn't be classified, the error message isn't formatted until it's used
+
+        Args:
+            position (int): position of the record
+            record (pandas.Series, optional): the record, only its ID is included in the exception if not provided
+
+        Returns:
+            ClassificationError or MultipleMatchesError: or None if the record was classified
+        """
+        status = self.status[position]
+        if status == CLASSIFIED:
+            return None
+
+        if record is None:
+            record = pd.Series({self.id_field: self.record_ids[position]} if self.id_field else {},
+                               name=self.index[position], dtype=object)
+
+        path = [self.couplets[c] for c in self.paths[self.path_ids[position]]]
+        if status == MULTIPLE_MATCHES:
+            return MultipleMatchesError(record, self.id_field, path[-1], self.matches[position])
+        return ClassificationError(record, self.id_field, path)
+
+    def path_table(self):
+        """
+        The couplets in each distinct decision path, join it to victa.results.ResultTable.to_frame on path_id
+        instead of writing out the steps of every record
+
+        Returns:
+            pandas.DataFrame: path ID, and the couplet and step of each couplet in each path,
+                the couplet type, name and comments are categorical
+        """
+        return self.paths.to_frame(self.couplets)
+
+    def steps(self):
+        """
+        The couplets traversed by each classified record, the same as the concatenated steps from victa.Key.classify
+
+        This has a row for every step of every record, see victa.results.ResultTable.path_table
+        for a much smaller alternative.
+
+        Returns:
+            pandas.DataFrame:
+        """
+        classified = np.flatnonzero(self.status == CLASSIFIED)
+        steps = self.paths.join(self.path_ids[classified], self.couplets, categorical=False)
+        if self.id_field:
+            record_ids = pd.Series(self.record_ids[classified]).infer_objects()
+            steps[self.id_field] = record_ids.values[steps['position'].to_numpy()]
+        return steps[list(Couplet._fields) + ['step'] + ([self.id_field] if self.id_field else [])]
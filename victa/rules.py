@@ -4,14 +4,42 @@ TODO Docstring
 __all__ = ['build_rules', 'Rule', 'RuleSet']
 
 import ast
+import numpy as np
+import operator
 import pandas as pd
 import re
 import sre_constants
+from functools import lru_cache
 
-from .errors import RuleSyntaxError, ManadatoryFieldError
+from .errors import RuleSyntaxError, ManadatoryFieldError, ValidationError
 from .utils import isclose
 
 
+# Text that float() will accept, after being stripped and upper cased
+_NUMBER = re.compile(r'[+-]?(?:(?:\d(?:_?\d)*(?:\.(?:\d(?:_?\d)*)?)?|\.\d(?:_?\d)*)(?:E[+-]?\d(?:_?\d)*)?'
+                     r'|INF(?:INITY)?|NAN)\Z')
+
+# Types that can be compared as a number without converting to text first, float(str(value)) == float(value)
+_NUMERIC = frozenset((int, float, np.float64, np.int8, np.int16, np.int32, np.int64,
+                      np.uint8, np.uint16, np.uint32, np.uint64))
+
+
+def _to_number(value):
+    """
+    Convert a record value to a float without raising an exception
+
+    Args:
+        value: record value
+
+    Returns:
+        float: or None if the value is not numeric
+    """
+    if value.__class__ in _NUMERIC:
+        return float(value)
+    text = str(value).strip().upper()
+    return float(text) if _NUMBER.match(text) else None
+
+
 # noinspection PyCallingNonCallable
 class Rule(object):
     """
@@ -19,6 +47,9 @@ class Rule(object):
 
     The instantiated Rule will return True or False when called with a record to test against.
 
+    Numeric comparison values are parsed once when the Rule is built and the operator is resolved to a
+    specialised comparison method, so testing a value doesn't rely on exceptions.
+
     Args:
         value (str): text string to look for
         attribute (str): attribute/column to use when rule is tested
@@ -32,80 +63,115 @@ class Rule(object):
         victa.Rule:
 
     """
+    __slots__ = ('value', 'number', 'attribute', 'operator', 'comparison', 'compare', 'name', 'comment')
+
+    operators = {  # Operator synonyms
+        '=': '=',
+        '==': '=',
+        'equals': '=',
+        'equal': '=',  # Required for backwards compatibility
+        'in': 'in',
+        '>=': '>=',
+        'ge': '>=',
+        '>': '>',
+        'gt': '>',
+        '<=': '<=',
+        'le': '<=',
+        '<': '<',
+        'lt': '<',
+        're': 'regex',
+        'regex': 'regex',
+    }
+
+    comparisons = {
+        '=': operator.eq,
+        '>=': operator.ge,
+        '>': operator.gt,
+        '<=': operator.le,
+        '<': operator.lt,
+    }
+
     def __init__(self, value, attribute, operator, name, comment=''):
         """
 
         Returns:
             object:
         """
-        self.operators = {   # Operator synonyms
-            '=': self._equal,
-            '==': self._equal,
-            'equals': self._equal,
-            'equal': self._equal,  # Required for backwards compatibility
-            'in': self._in,
-            '>=': self._ge,
-            'ge': self._ge,
-            '>': self._gt,
-            'gt': self._gt,
-            '<=': self._le,
-            'le': self._le,
-            '<': self._lt,
-            'lt': self._lt,
-            're': self._re,
-            'regex': self._re,
-        }
-
         self.attribute = str(attribute).strip()
         self.operator = self.operators[str(operator).strip().lower()]
+        self.comparison = self.comparisons.get(self.operator)
+        self.number = None
 
-        if self.operator == self._re:
+        if self.operator == 'regex':
             try:
                 self.value = re.compile(str(value).strip(), re.IGNORECASE)
             except sre_constants.error as e:
                 raise RuleSyntaxError('Invalid regex syntax "{}": {}'.format(e.pattern, ','.join(e.args)))
+            self.compare = self._re
         else:
             self.value = str(value).strip().upper()  # TODO think about/handle case. What about regexes?
+            if self.operator == 'in':
+                self.compare = self._in
+            else:
+                self.number = _to_number(self.value)
+                if self.number is None:
+                    self.compare = self._text
+                elif self.operator == '=':
+                    self.compare = self._equal
+                else:
+                    self.compare = self._numeric
 
         self.name = str(name).strip()
         self.comment = str(comment).strip()
 
+    def __reduce__(self):
+        # The rule is restored without validating it again and regexes are only compiled when they're first used,
+        # so loading a large saved key is fast
+        value = getattr(self.value, 'pattern', self.value)
+        return _unpickle_rule, (value, self.number, self.attribute, self.operator, self.name, self.comment)
+
+    def __repr__(self):
+        value = getattr(self.value, 'pattern', self.value)
+        return 'Rule({!r}, {!r}, {!r}, {!r})'.format(value, self.attribute, self.operator, self.name)
+
     def _equal(self, value):
-        try:
-            return isclose(float(value), float(self.value))
-        except ValueError:
-            return value == self.value
+        if value.__class__ in _NUMERIC:
+            return isclose(float(value), self.number)
+        value = str(value).strip().upper()
+        if _NUMBER.match(value):
+            return isclose(float(value), self.number)
+        return value == self.value
+
+    def _numeric(self, value):
+        if value.__class__ in _NUMERIC:
+            return self.comparison(float(value), self.number)
+        value = str(value).strip().upper()
+        if _NUMBER.match(value):
+            return self.comparison(float(value), self.number)
+        return self.comparison(value, self.value)
+
+    def _equal_number(self, value):
+        return isclose(float(value), self.number)
+
+    def _numeric_number(self, value):
+        return self.comparison(float(value), self.number)
+
+    def _text(self, value):
+        return self.comparison(str(value).strip().upper(), self.value)
 
     def _in(self, value):
-        return self.value in value
+        return self.value in str(value).strip().upper()
 
     def _re(self, value):
         # noinspection PyUnresolvedReferences
-        return True if self.value.search(value) else False
+        return self.value.search(str(value).strip().upper()) is not None
 
-    def _ge(self, value):
-        try:
-            return float(value) >= float(self.value)
-        except ValueError:
-            return value >= self.value
-
-    def _gt(self, value):
-        try:
-            return float(value) > float(self.value)
-        except ValueError:
-            return value > self.value
-
-    def _le(self, value):
-        try:
-            return float(value) <= float(self.value)
-        except ValueError:
-            return value <= self.value
-
-    def _lt(self, value):
-        try:
-            return float(value) < float(self.value)
-        except ValueError:
-            return value < self.value
+    def _compile_re(self, value):
+        # Regexes of unpickled rules are compiled on first use
+        if isinstance(self.value, str):
+            self.value = re.compile(self.value, re.IGNORECASE)
+            self.compare = self._re
+        return self._re(value)
 
     def __call__(self, record):
         """
@@ -117,58 +183,204 @@ class Rule(object):
             Bool:
         """
 
-        value = str(getattr(record, self.attribute)).strip().upper()
-        return self.operator(value)
+        return self.test(getattr(record, self.attribute))
+
+    def test(self, value):
+        """
+        Test a rule against a single attribute value
+
+        Args:
+            value: attribute value
+
+        Returns:
+            Bool:
+        """
+        return self.compare(value)
+
+    def specialise(self, kind):
+        """
+        Get a comparison method specialised for attribute values of a known type
+
+        Args:
+            kind (str): attribute type, 'numeric', 'string' or 'mixed'. See victa.records.Schema
+
+        Returns:
+            function: :code:`compare(value)`
+        """
+        if self.number is not None and self.comparison is not None:
+            if kind == 'numeric':
+                return self._equal_number if self.operator == '=' else self._numeric_number
+            elif kind == 'string':
+                return self._text
+        return self.compare
+
+    def mask(self, values):
+        """
+        Test a rule against an array of attribute values.
+
+        Each distinct value is only tested once.
+
+        Args:
+            values (pandas.Series): attribute values
+
+        Returns:
+            numpy.ndarray: boolean mask
+        """
+        codes, uniques = factorize(values)
+        return self.test_uniques(uniques)[codes]
+
+    def test_uniques(self, uniques):
+        """
+        Test a rule against a sequence of (distinct) attribute values
+
+        Args:
+            uniques (sequence): attribute values
+
+        Returns:
+            numpy.ndarray: boolean array
+        """
+        return np.fromiter((self.test(value) for value in uniques), dtype=bool, count=len(uniques))
+
+    def test_numbers(self, numbers):
+        """
+        Test a rule against an array of numbers, the rule value must be numeric
+
+        Args:
+            numbers (numpy.ndarray): float attribute values
+
+        Returns:
+            numpy.ndarray: boolean array
+        """
+        if self.operator == '=':
+            # Same as isclose(number, self.number)
+            tolerance = 1e-09 * np.maximum(np.abs(numbers), abs(self.number))
+            with np.errstate(invalid='ignore'):
+                return (numbers == self.number) | (np.isfinite(numbers) & (np.abs(numbers - self.number) <= tolerance))
+        return self.comparison(numbers, self.number)
 
 
 # noinspection PyTypeChecker
 class RuleSet(dict):
 
-    def test(self, expr, record):
+    def specialise(self, schema):
+        """
+        Get tests for each rule that are specialised for the attribute types of a batch of records
+
+        Args:
+            schema (victa.records.Schema): attribute types
+
+        Returns:
+            dict: :code:`test(record)` function for each rule ID, can be passed to victa.rules.RuleResults
+        """
+        tests = {}
+        for rule_id, rule in self.items():
+            if isinstance(rule, Rule):
+                rule = _specialised(rule.specialise(schema[rule.attribute]), rule.attribute)
+            tests[rule_id] = rule
+        return tests
+
+    def test(self, expr, record, results=None):
         """
         Test a ruleset expression against a record
 
         Args:
-            expr (str): string expression to be evaluated
+            expr (str or function): string expression to be evaluated or an expression already compiled by
+                victa.rules.parse
             record (pandas.Series): record to test against expression
+            results (victa.rules.RuleResults, optional): cached rule results for :code:`record`,
+                pass the same results when testing multiple expressions against a record
+                so each rule is only tested once
 
         Returns:
             Bool:
 
         """
-        return eval(self._parse(expr), {}, {'self': self, 'record': record})
+        if not callable(expr):
+            expr = self._parse(expr)
+        if results is None:
+            results = RuleResults(self, record)
+        return expr(results)
 
-    # noinspection PyMethodMayBeStatic
-    def _parse(self, expr):
+    def mask(self, expr, records, masks=None, rows=None):
         """
-        Black magic happens here... :)
+        Test a ruleset expression against a DataFrame of records
 
-        What this does is turn a string expression like :code:`not (123 or 456)` into a compiled code object ready for
-        evaluation, such as :code:`not (ruleset[123](record) or ruleset[456](record))`
+        Args:
+            expr (str): string expression to be evaluated
+            records (pandas.DataFrame): records to test against expression
+            masks (victa.rules.RuleMasks, optional): cached rule results for :code:`records`
+            rows (numpy.ndarray, optional): integer positions of the records to test, default is all records
 
-        We do this by assuming each integer is a rule ID and altering the expression using an ast.NodeTransformer to
-        convert each integer node to a callable function
+        Returns:
+            numpy.ndarray: boolean mask, one element per row
+        """
+        if masks is None:
+            masks = RuleMasks(self, records)
+        if rows is None:
+            rows = np.arange(len(records))
+        return self._parse(expr, RuleMaskTransformer)(masks, rows)
+
+    # noinspection PyMethodMayBeStatic
+    def _parse(self, expr, transformer=None):
+        """
+        Compile a string expression, see victa.rules.parse
 
         Args:
             expr (str): string expression to be evaluated
+            transformer (type, optional): ast.NodeTransformer subclass, default is RuleSetTransformer
 
         Returns:
-            code (object):
+            function:
         """
-        transformer = RuleSetTransformer()
-        expr = str(expr).strip()  # str(expr) to handle pandas parsing '321' as int
-                                  # .strip() to handle '" blah" is not valid python syntax, unexpected indent'
-        try:
-            ast_expr = ast.parse(expr, mode='eval')
-            ast_expr = transformer.visit(ast_expr)  # this automagically invokes RuleSetTransformer.visit_Num
-            ast.fix_missing_locations(ast_expr)
-            return compile(ast_expr, '', 'eval')
-        except SyntaxError as err:
-            raise RuleSyntaxError('The ruleset expression "{}" is not valid python syntax, {}'.format(expr, err.msg))
+        return parse(expr, transformer)
+
+
+def parse(expr, transformer=None):
+    """
+    Black magic happens here... :)
+
+    What this does is turn a string expression like :code:`not (123 or 456)` into a compiled function ready for
+    evaluation, such as :code:`lambda results: not (results(123) or results(456))`
+
+    We do this by assuming each integer is a rule ID and altering the expression using an ast.NodeTransformer to
+    convert each integer node to a callable function
+
+    Compiled expressions are cached, so the same expression is only ever parsed once.
+
+    Args:
+        expr (str): string expression to be evaluated
+        transformer (type, optional): ast.NodeTransformer subclass, default is RuleSetTransformer
+
+    Returns:
+        function:
+
+    Raises:
+        RuleSyntaxError: if the expression is not valid python syntax
+    """
+    expr = str(expr).strip()  # str(expr) to handle pandas parsing '321' as int
+                              # .strip() to handle '" blah" is not valid python syntax, unexpected indent'
+    return _compile(expr, transformer or RuleSetTransformer)
+
+
+@lru_cache(maxsize=4096)
+def _compile(expr, transformer):
+    try:
+        ast_expr = ast.parse(expr, mode='eval')
+        ast_expr = transformer().visit(ast_expr)  # this automagically invokes RuleSetTransformer.visit_Num
+
+        # Wrap the expression in a lambda so it can be called without eval()
+        func = ast.parse('lambda {}: None'.format(', '.join(transformer.args)), mode='eval')
+        func.body.body = ast_expr.body
+        ast.fix_missing_locations(func)
+        return eval(compile(func, '<ruleset>', 'eval'), {})
+    except SyntaxError as err:
+        raise RuleSyntaxError('The ruleset expression "{}" is not valid python syntax, {}'.format(expr, err.msg))
 
 
 class RuleSetTransformer(ast.NodeTransformer):
 
+    args = ('results', )  # compiled function arguments
+
     # noinspection PyMethodMayBeStatic
     def visit_Num(self, node):
         """
@@ -182,16 +394,213 @@ class RuleSetTransformer(ast.NodeTransformer):
             node (ast.node):
         """
         # TODO this is hard to debug, is there a better way?
-        value = ast.Name(id='self', ctx=ast.Load())
-        slice = ast.Index(value=node)
-        func = ast.Subscript(value=value, slice=slice, ctx=ast.Load())
+        func = ast.Name(id='results', ctx=ast.Load())
+        call = ast.Call(func=func, args=[node], keywords=[])
+        return call
+
+
+class RuleMaskTransformer(RuleSetTransformer):
+    """
+    Turn a string expression like :code:`not (123 or 456)` into a vectorised expression such as
+    :code:`~(masks(123, rows) | masks(456, rows))`
+    """
+
+    args = ('masks', 'rows')
+    operators = {ast.And: ast.BitAnd, ast.Or: ast.BitOr}
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = self.operators[type(node.op)]()
+        expr = node.values[0]
+        for value in node.values[1:]:
+            expr = ast.BinOp(left=expr, op=op, right=value)
+        return expr
 
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            node.op = ast.Invert()
+        return node
+
+    # noinspection PyMethodMayBeStatic
+    def visit_Num(self, node):
+        func = ast.Name(id='masks', ctx=ast.Load())
         call = ast.Call(func=func,
-                        args=[ast.Name(id='record', ctx=ast.Load())],
+                        args=[node, ast.Name(id='rows', ctx=ast.Load())],
                         keywords=[])
         return call
 
 
+def _unpickle_rule(value, number, attribute, operator, name, comment):
+    """Restore a pickled Rule"""
+    rule = Rule.__new__(Rule)
+    rule.value, rule.number, rule.attribute, rule.operator, rule.name, rule.comment = (
+        value, number, attribute, operator, name, comment)
+    rule.comparison = Rule.comparisons.get(operator)
+
+    if operator == 'regex':
+        rule.compare = rule._compile_re
+    elif operator == 'in':
+        rule.compare = rule._in
+    elif number is None:
+        rule.compare = rule._text
+    elif operator == '=':
+        rule.compare = rule._equal
+    else:
+        rule.compare = rule._numeric
+    return rule
+
+
+def _specialised(compare, attribute):
+    def test(record):
+        return compare(getattr(record, attribute))
+    return test
+
+
+class RuleResults(dict):
+    """
+    Rule results for a single record.
+
+    Each rule is only tested once, no matter how many rulesets it is used in.
+
+    Args:
+        ruleset (victa.RuleSet or dict): rules to test, or specialised tests from victa.RuleSet.specialise
+        record (pandas.Series): record to be tested
+
+    Attributes:
+        hits (int): number of rule tests saved by reusing a cached result
+    """
+    def __init__(self, ruleset, record):
+        super(RuleResults, self).__init__()
+        self.ruleset = ruleset
+        self.record = record
+        self.hits = 0
+
+    def __call__(self, rule_id):
+        """
+        Args:
+            rule_id (int): rule to look up
+
+        Returns:
+            Bool:
+        """
+        if rule_id in self:
+            self.hits += 1
+            return self[rule_id]
+
+        result = self[rule_id] = self.ruleset[rule_id](self.record)
+        return result
+
+
+class RuleMasks(dict):
+    """
+    Vectorised rule results for a DataFrame of records.
+
+    Each rule is tested once against the distinct values of its attribute and the
+    results are cached, so any subset of rows can be looked up without retesting.
+
+    Rules with numeric values are compared directly to numeric attributes.
+
+    Args:
+        ruleset (victa.RuleSet): rules to test
+        records (pandas.DataFrame): records to be tested
+        schema (victa.records.Schema, optional): attribute types of the records
+        matchers (dict, optional): matchers by rule ID, all the rules in a group are tested together
+            against the distinct values of their attribute, see victa.matchers.group_rules
+    """
+    def __init__(self, ruleset, records, schema=None, matchers=None):
+        super(RuleMasks, self).__init__()
+        self.ruleset = ruleset
+        self.records = records
+        self.schema = schema
+        self.matchers = matchers or {}
+        self.columns = {}
+
+    def __missing__(self, rule_id):
+        rule = self.ruleset[rule_id]
+        if rule.number is not None and rule.comparison is not None and self.schema is not None:
+            if self.schema[rule.attribute] == 'numeric':
+                numbers = self.records[rule.attribute].to_numpy(dtype=float)
+                result = self[rule_id] = rule.test_numbers(numbers), None
+                return result
+
+        matcher = self.matchers.get(rule_id)
+        if matcher is not None:
+            codes, uniques = self._factorize(rule.attribute)
+            for grouped_id, results in matcher.test_uniques(uniques).items():
+                self[grouped_id] = results, codes
+            return self[rule_id]
+
+        codes, uniques = self._factorize(rule.attribute)
+        result = self[rule_id] = rule.test_uniques(uniques), codes
+        return result
+
+    def _factorize(self, attribute):
+        try:
+            return self.columns[attribute]
+        except KeyError:
+            result = self.columns[attribute] = factorize(self.records[attribute])
+            return result
+
+    def __call__(self, rule_id, rows):
+        """
+        Args:
+            rule_id (int): rule to look up
+            rows (numpy.ndarray): integer positions of the records
+
+        Returns:
+            numpy.ndarray: boolean mask, one element per row
+        """
+        results, codes = self[rule_id]
+        if codes is None:
+            return results[rows]
+        return results[codes[rows]]
+
+
+def factorize(values):
+    """
+    Encode values as integer codes and distinct values.
+
+    Unlike :code:`pandas.factorize`, null values are not discarded, each distinct
+    text representation of a null (None, NaN, etc...) is kept as a separate value,
+    as that is what a :code:`Rule` will see when testing a single value.
+    Values that are equal but could be tested differently by a rule (e.g. :code:`1`, :code:`1.0` and
+    :code:`True`, or :code:`0.0` and :code:`-0.0` with a regex) are also kept as separate values.
+
+    Args:
+        values (pandas.Series): values to encode
+
+    Returns:
+        tuple(numpy.ndarray, list): codes and distinct values
+    """
+    if getattr(values, 'dtype', None) == object and pd.api.types.infer_dtype(values, skipna=False) != 'string':
+        # Mixed types, group by type and representation, the first value of each group is kept
+        values = np.asarray(values, dtype=object)
+        keys = np.empty(len(values), dtype=object)
+        keys[:] = [(v.__class__, repr(v)) for v in values]
+        codes, _ = pd.factorize(keys)
+        return codes, list(values[np.unique(codes, return_index=True)[1]])
+
+    codes, uniques = pd.factorize(values)
+    uniques = list(uniques)
+
+    if getattr(values, 'dtype', None) is not None and values.dtype.kind == 'f':
+        numbers = np.asarray(values)
+        negative = (numbers == 0) & np.signbit(numbers)
+        if negative.any():
+            codes[negative] = len(uniques)
+            uniques.append(-0.0)
+
+    nulls = np.flatnonzero(codes == -1)
+    if nulls.size:
+        nullvalues = np.asarray(values, dtype=object)[nulls]
+        nullcodes, nulltext = pd.factorize(np.array([str(v) for v in nullvalues], dtype=object))
+        codes[nulls] = nullcodes + len(uniques)
+        uniques += [nullvalues[np.argmax(nullcodes == c)] for c in range(len(nulltext))]
+
+    return codes, uniques
+
+
 def build_rules(rules_df):
     """
     Build a RuleSet of Rule objects from a Pandas DataFrame containing the rule definitions
@@ -211,27 +620,54 @@ def build_rules(rules_df):
     Returns:
         ruleset: victa.RuleSet
 
+    Raises:
+        ManadatoryFieldError: if any mandatory fields are empty, along with any other problems
+        ValidationError: for all the rows with a duplicate or non integer ID, unknown OPERATOR or invalid regex
+
     Note:
         -  Order for ordinal comparisons is ATTRIBUTE operator VALUE, i.e ATTRIBUTE >= 5.0
     """
-    ruleset = RuleSet()
-    for idx, row in rules_df.iterrows():
-        # Ensure mandatory fields are not empty
-        mandatory = ['ID', 'ATTRIBUTE', 'OPERATOR', 'VALUE', 'NAME']
-        test = row.loc[mandatory]
-        if test.isnull().any():
-            fields = ', '.join(['"{}"'.format(m) for m in mandatory])
-            values = test.to_dict()
-            raise ManadatoryFieldError('All of {} must contain a value: {}'.format(fields, values))
-
-        rule_id = int(row['ID'])
-        comment = '' if pd.isnull(row['COMMENTS']) else row['COMMENTS']
-
-        rule = Rule(value=row['VALUE'],
-                    attribute=row['ATTRIBUTE'],
-                    operator=row['OPERATOR'],
-                    name=row['NAME'],
-                    comment=comment)
-        ruleset[rule_id] = rule
+    mandatory = ['ID', 'ATTRIBUTE', 'OPERATOR', 'VALUE', 'NAME']
+    missing = [column for column in mandatory if column not in rules_df]
+    if missing:
+        raise ManadatoryFieldError('Missing columns {}'.format(', '.join('"{}"'.format(m) for m in missing)), 'rules')
+
+    # Ensure mandatory fields are not empty, checking every row at once
+    nulls = rules_df[mandatory].isnull().any(axis=1).to_numpy()
+    error = ManadatoryFieldError if nulls.any() else ValidationError
+    fields = ', '.join(['"{}"'.format(m) for m in mandatory])
+
+    comments = rules_df['COMMENTS'].fillna('').tolist() if 'COMMENTS' in rules_df else [''] * len(rules_df)
+    columns = [rules_df[c].tolist() for c in mandatory]
+
+    # Problems are listed in row order, the same as victa.key.build_key
+    ruleset, rows, problems = RuleSet(), {}, []
+    for label, null, rule_id, attribute, operator, value, name, comment in zip(
+            rules_df.index, nulls, *columns, comments):
+        if null:
+            values = dict(zip(mandatory, (rule_id, attribute, operator, value, name)))
+            problems.append((label, 'All of {} must contain a value: {}'.format(fields, values)))
+            continue
+
+        try:
+            rule_id = int(rule_id)
+        except (TypeError, ValueError):
+            problems.append((label, '"ID" must be an integer: {!r}'.format(rule_id)))
+            continue
+
+        if rule_id in rows:
+            problems.append((label, 'Duplicate rule "ID" {} (also row {})'.format(rule_id, rows[rule_id])))
+            continue
+        rows[rule_id] = label
+
+        try:
+            ruleset[rule_id] = Rule(value=value, attribute=attribute, operator=operator, name=name, comment=comment)
+        except KeyError:
+            problems.append((label, 'Unknown "OPERATOR" {!r}'.format(operator)))
+        except RuleSyntaxError as err:
+            problems.append((label, str(err)))
+
+    if problems:
+        raise error(problems, 'rules')
 
     return ruleset
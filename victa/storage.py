@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+
+Save and load built classification keys
+
+A saved key carries a fingerprint of the key and rules it was built from, so a saved key that is out of date
+can be detected and rebuilt. The file format and victa version are pickled in a small header before the key,
+so a key saved by a different version is detected without unpickling it (which could fail as classes change).
+Saved keys are pickles, only load files from a trusted source.
+
+"""
+
+__all__ = ['fingerprint', 'save', 'load', 'read_table', 'NA_VALUES']
+
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+from .errors import StaleKeyError
+
+# Strings read as NaN by victa.storage.read_table. Unlike the pandas defaults, 'NULL', 'NA' etc.
+# are kept as text as they are valid attribute values in some vegetation datasets
+NA_VALUES = {
+    '-1.#QNAN', '-nan', '', '-NaN', '#NA', 'N/A', 'NaN', '#N/A', '1.#QNAN', '1.#IND', 'nan', '-1.#IND', '#N/A N/A'}
+
+FORMAT = 5  # Saved key file format version
+
+
+def fingerprint(key_df, key_desc, rules_df):
+    """
+    Fingerprint the sources of a key
+
+    Args:
+        key_df (pandas.DataFrame or str): key DataFrame, see victa.key.build_key, or the path to a file containing it
+        key_desc (str): key description
+        rules_df (pandas.DataFrame or str): rules DataFrame, see victa.rules.build_rules, or the path to a file
+            containing them
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+    for source in (key_df, key_desc, rules_df):
+        if isinstance(source, pd.DataFrame):
+            digest.update(repr([str(column).upper() for column in source.columns]).encode())
+            digest.update(pd.util.hash_pandas_object(source, index=False).to_numpy().tobytes())
+        elif source is not key_desc and _is_path(source):
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(2 ** 20), b''):
+                    digest.update(block)
+        else:
+            digest.update(repr(source).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def save(key, path):
+    """
+    Save a built key to a file, see victa.Key.save
+
+    Args:
+        key (victa.Key): key to save
+        path (str): file path
+    """
+    from . import __version__
+    with open(path, 'wb') as f:
+        header = {'format': FORMAT, 'version': __version__, 'fingerprint': key.fingerprint}
+        pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+
+
+def load(path, expected=None):
+    """
+    Load a key saved by victa.storage.save, see victa.Key.load
+
+    Args:
+        path (str): file path
+        expected (str, optional): fingerprint the key must have, see victa.storage.fingerprint
+
+    Returns:
+        victa.Key:
+
+    Raises:
+        StaleKeyError: if the key was saved by a different version of victa or its fingerprint doesn't match
+    """
+    from . import __version__
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+        if not isinstance(header, dict) or header.get('format') != FORMAT or header.get('version') != __version__:
+            raise StaleKeyError('"{}" was saved by a different version of victa'.format(path))
+        if expected is not None and header['fingerprint'] != expected:
+            raise StaleKeyError('"{}" was built from a different key or rules'.format(path))
+        return pickle.load(f)
+
+
+def read_table(path, **kwargs):
+    """
+    Read a key, rules or records table from an excel (.xls, .xlsx) or csv file
+
+    Only the strings in victa.storage.NA_VALUES are read as NaN,
+    so text such as 'NULL' and 'NA' is kept as is.
+
+    Args:
+        path (str): file path
+        **kwargs: passed to pandas.read_excel or pandas.read_csv, e.g. sheet_name, usecols or chunksize
+
+    Returns:
+        pandas.DataFrame:
+    """
+    kwargs.setdefault('na_values', NA_VALUES)
+    kwargs.setdefault('keep_default_na', False)
+    if str(path).lower().endswith(('.xls', '.xlsx', '.xlsm')):
+        return pd.read_excel(path, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def _is_path(source):
+    return isinstance(source, (str, bytes, os.PathLike))